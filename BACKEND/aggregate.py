@@ -0,0 +1,110 @@
+"""Server-side match aggregation for large results.
+
+Instead of returning every [start,end) range, a sequence can be summarized at
+a fixed resolution: a match-density histogram and coverage track over `bins`
+equal-width bins, plus the top-K hotspot intervals (runs of overlapping
+matches). Everything is computed with NumPy from the match start/end arrays,
+so response size depends on the requested bin count, not the match count.
+"""
+import numpy as np
+
+# Everything on a "  Matches: [a,b) [c,d) " line that isn't a number.
+_RANGE_DELIMITERS = str.maketrans(dict.fromkeys("Matches:[,)", " "))
+
+
+def parse_range_array(matches_line: str) -> tuple[np.ndarray, np.ndarray]:
+    """Parse a 'Matches: [a,b) [c,d) ...' line (label optional) into start and end arrays.
+
+    Parsing happens in NumPy's text reader, without a Python object per
+    number or an intermediate substring.
+    """
+    values = np.fromstring(matches_line.translate(_RANGE_DELIMITERS), dtype=np.int64, sep=" ")
+    return values[0::2], values[1::2]
+
+
+def _depth_profile(starts: np.ndarray, ends: np.ndarray, length: int) -> np.ndarray:
+    """Number of matches covering each position."""
+    delta = np.zeros(length + 1, dtype=np.int32)
+    np.add.at(delta, starts, 1)
+    np.add.at(delta, ends, -1)
+    return np.cumsum(delta, out=delta)[:length]
+
+
+def covered_length(starts: np.ndarray, ends: np.ndarray) -> int:
+    """Number of positions covered by at least one match (union of the ranges)."""
+    if not starts.size:
+        return 0
+    if np.any(starts[1:] < starts[:-1]):
+        order = np.argsort(starts, kind="stable")
+        starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    first = np.flatnonzero(np.r_[True, starts[1:] > reach[:-1]])
+    last = np.r_[first[1:] - 1, starts.size - 1]
+    return int(np.sum(reach[last] - starts[first]))
+
+
+def density_track(starts: np.ndarray, depth: np.ndarray, bins: int) -> dict:
+    """Per-bin match counts (by start), covered fraction and peak depth."""
+    length = depth.size
+    bins = min(bins, length)
+    edges = np.arange(bins + 1, dtype=np.int64) * length // bins
+    widths = np.diff(edges)
+    bin_of_start = np.searchsorted(edges, starts, side="right") - 1
+    covered = np.add.reduceat(depth > 0, edges[:-1], dtype=np.int64)
+    return {
+        "bins": bins,
+        "bin_edges": edges.tolist(),
+        "match_counts": np.bincount(bin_of_start, minlength=bins).tolist(),
+        "coverage": (covered / widths).tolist(),
+        "max_depth": np.maximum.reduceat(depth, edges[:-1]).tolist(),
+    }
+
+
+def hotspots(starts: np.ndarray, ends: np.ndarray, depth: np.ndarray, top_k: int) -> list[dict]:
+    """Top-K runs of overlapping or touching matches, by number of matches."""
+    if not top_k or not starts.size:
+        return []
+    if np.any(starts[1:] < starts[:-1]):
+        # The binary reports matches by start already; only sort other input.
+        order = np.argsort(starts, kind="stable")
+        starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    first = np.flatnonzero(np.r_[True, starts[1:] > reach[:-1]])
+    counts = np.diff(np.r_[first, starts.size])
+    run_starts = starts[first]
+    run_ends = np.maximum.reduceat(ends, first)
+    peak = np.maximum.reduceat(depth, run_starts) if depth.size else np.zeros_like(run_starts)
+    ranked = np.lexsort((run_starts, -counts))[:top_k]
+    return [
+        {"start": start, "end": end, "match_count": count, "max_depth": max_depth}
+        for start, end, count, max_depth in zip(
+            run_starts[ranked].tolist(), run_ends[ranked].tolist(), counts[ranked].tolist(), peak[ranked].tolist()
+        )
+    ]
+
+
+def summarize_matches(starts: np.ndarray, ends: np.ndarray, length: int, options: dict) -> tuple[int, dict]:
+    """Return how many raw ranges to keep and the array-derived sequence fields.
+
+    The fields are match_count, has_matches, coverage and matches_truncated,
+    plus `density` and `hotspots` when bins are requested. With count_only no
+    raw ranges are kept; otherwise at most max_matches.
+    """
+    count = int(starts.size)
+    keep = 0 if options["count_only"] else count
+    if options["max_matches"] is not None:
+        keep = min(keep, options["max_matches"])
+
+    depth = _depth_profile(starts, ends, length) if count and length else np.zeros(0, dtype=np.int32)
+    fields = {
+        "match_count": count,
+        "has_matches": count > 0,
+        "coverage": float(np.count_nonzero(depth)) / length if depth.size else 0.0,
+        "matches_truncated": keep < count,
+    }
+    if options["bins"] is not None and length:
+        if not depth.size:
+            depth = np.zeros(length, dtype=np.int32)
+        fields["density"] = density_track(starts, depth, options["bins"])
+        fields["hotspots"] = hotspots(starts, ends, depth, options["top_k"])
+    return keep, fields
@@ -0,0 +1,371 @@
+"""Post-processing of `--dump-automaton` output for the frontend.
+
+Dumps can be large: a DFA from subset construction may have redundant
+states, and `.` becomes 256 parallel transitions. Requests pick a view:
+
+- full: the dump as the binary wrote it (default).
+- minimal: DFAs minimized (Hopcroft), and parallel transitions between the
+  same two states merged into one edge with a character-class label. Same
+  shape as the full dump.
+- compact: the minimal automaton as an indexed graph (state table plus
+  parallel edge arrays and a label table), optionally capped at
+  `max_states` states in breadth-first order from the start state.
+- none: no automaton (the dump is skipped altogether).
+
+Processed views are cached per (mode, pattern, mismatch budget, view, cap),
+and a cache hit lets the request skip `--dump-automaton` entirely.
+"""
+import sys
+import threading
+from collections import OrderedDict, defaultdict
+
+from config import AUTOMATON_CACHE_BYTES
+
+ALL_CODES = 256
+EPSILON_LABEL = "ε"
+
+
+def class_label(codes) -> str:
+    """Label a set of byte codes: 'A', '[CG]', '[A-Z]' or 'any'."""
+    codes = sorted(set(codes))
+    if len(codes) == ALL_CODES:
+        return "any"
+    if len(codes) == 1:
+        return chr(codes[0])
+    parts = []
+    run_start = previous = codes[0]
+    for code in codes[1:] + [None]:
+        if code is not None and code == previous + 1:
+            previous = code
+            continue
+        if previous - run_start >= 2:
+            parts.append(f"{_printable(run_start)}-{_printable(previous)}")
+        else:
+            parts.extend(_printable(c) for c in range(run_start, previous + 1))
+        if code is not None:
+            run_start = previous = code
+    return "[" + "".join(parts) + "]"
+
+
+def _printable(code: int) -> str:
+    char = chr(code)
+    if char in "[]-\\":
+        return "\\" + char
+    return char if 32 < code < 127 else f"\\x{code:02x}"
+
+
+def _reachable(start: int, successors) -> list[int]:
+    """State ids reachable from `start`, in breadth-first order."""
+    order = [start]
+    seen = {start}
+    for state in order:
+        for target in successors(state):
+            if target not in seen:
+                seen.add(target)
+                order.append(target)
+    return order
+
+
+def minimize_dfa(dump: dict) -> dict:
+    """Minimize a (partial) DFA dump with Hopcroft's algorithm.
+
+    Missing transitions go to an implicit dead state, which is dropped again
+    (with every state equivalent to it) from the result. States are
+    renumbered breadth-first from the start state.
+    """
+    states = {state["id"]: state for state in dump["states"]}
+    order = _reachable(dump["start"], lambda sid: (t["to"] for t in states[sid]["transitions"]))
+    index = {sid: i for i, sid in enumerate(order)}
+    symbols = {}
+    for sid in order:
+        for transition in states[sid]["transitions"]:
+            symbols.setdefault(transition["code"], transition["symbol"])
+    alphabet = sorted(symbols)
+    column = {code: i for i, code in enumerate(alphabet)}
+
+    dead = len(order)
+    delta = [[dead] * len(alphabet) for _ in range(dead + 1)]
+    for sid in order:
+        row = delta[index[sid]]
+        for transition in states[sid]["transitions"]:
+            row[column[transition["code"]]] = index[transition["to"]]
+    inverse = [defaultdict(list) for _ in alphabet]
+    for source, row in enumerate(delta):
+        for symbol, target in enumerate(row):
+            inverse[symbol][target].append(source)
+
+    accepting = {index[sid] for sid in order if states[sid]["accept"]}
+    rejecting = set(range(dead + 1)) - accepting
+    blocks = [block for block in (accepting, rejecting) if block]
+    block_of = [0] * (dead + 1)
+    for number, block in enumerate(blocks):
+        for state in block:
+            block_of[state] = number
+    worklist = {min(range(len(blocks)), key=lambda number: len(blocks[number]))}
+
+    while worklist:
+        splitter = set(blocks[worklist.pop()])
+        for symbol in range(len(alphabet)):
+            predecessors = {source for target in splitter for source in inverse[symbol].get(target, ())}
+            touched = defaultdict(set)
+            for state in predecessors:
+                touched[block_of[state]].add(state)
+            for number, inside in touched.items():
+                block = blocks[number]
+                if len(inside) == len(block):
+                    continue
+                outside = block - inside
+                blocks[number] = inside
+                blocks.append(outside)
+                new_number = len(blocks) - 1
+                for state in outside:
+                    block_of[state] = new_number
+                if number in worklist:
+                    worklist.add(new_number)
+                else:
+                    worklist.add(number if len(inside) <= len(outside) else new_number)
+
+    dead_block = block_of[dead]
+    representative = {number: min(block) for number, block in enumerate(blocks)}
+
+    def block_successors(number):
+        row = delta[representative[number]]
+        return (block_of[target] for target in row if block_of[target] != dead_block)
+
+    start_block = block_of[0]
+    if start_block == dead_block:
+        block_order = []
+    else:
+        block_order = _reachable(start_block, block_successors)
+    renumber = {number: new_id for new_id, number in enumerate(block_order)}
+    minimized = []
+    for number in block_order:
+        row = delta[representative[number]]
+        transitions = [
+            {"code": code, "symbol": symbols[code], "to": renumber[block_of[target]]}
+            for code, target in zip(alphabet, row)
+            if block_of[target] != dead_block
+        ]
+        minimized.append({
+            "id": renumber[number],
+            "accept": representative[number] in accepting,
+            "transitions": transitions,
+        })
+    return {
+        **{key: value for key, value in dump.items() if key != "states"},
+        "start": 0,
+        "states": minimized,
+        "minimized": {"states_before": len(states), "states_after": len(minimized)},
+    }
+
+
+def _merge_dfa_state(state: dict, key: str = "transitions") -> dict:
+    by_target = defaultdict(list)
+    for transition in state[key]:
+        by_target[(transition["to"], transition.get("operation"))].append(transition)
+    merged = []
+    for (target, operation), group in by_target.items():
+        if len(group) == 1:
+            merged.append(group[0])
+            continue
+        edge = {"symbol": class_label(t["code"] for t in group), "to": target, "count": len(group)}
+        if operation is not None:
+            edge["operation"] = operation
+        merged.append(edge)
+    return {**state, key: merged}
+
+
+def _edge_codes(edge: dict) -> set[int]:
+    if edge["type"] == "literal":
+        return {ord(edge["literal"])}
+    if edge["type"] == "char_class":
+        return {ord(char) for char in edge["charClass"]}
+    return set(range(ALL_CODES))
+
+
+def _merge_nfa_state(state: dict) -> dict:
+    merged = []
+    by_target = defaultdict(set)
+    for edge in state["edges"]:
+        if edge["type"] in {"literal", "char_class", "any"}:
+            by_target[edge["to"]] |= _edge_codes(edge)
+        else:
+            merged.append(edge)
+    for target, codes in by_target.items():
+        if len(codes) == ALL_CODES:
+            merged.append({"to": target, "type": "any"})
+        elif len(codes) == 1:
+            merged.append({"to": target, "type": "literal", "literal": chr(next(iter(codes)))})
+        else:
+            merged.append({"to": target, "type": "char_class", "charClass": "".join(chr(c) for c in sorted(codes))})
+    return {**state, "edges": merged}
+
+
+def merge_parallel_edges(dump: dict) -> dict:
+    """Merge transitions between the same pair of states into one labelled edge."""
+    kind = dump.get("kind")
+    if kind == "NFA":
+        return {**dump, "states": [_merge_nfa_state(state) for state in dump["states"]]}
+    if kind == "EFA" and isinstance(dump.get("nfa"), dict):
+        return {**dump, "nfa": merge_parallel_edges(dump["nfa"])}
+    if kind in {"DFA", "PDA"}:
+        return {**dump, "states": [_merge_dfa_state(state) for state in dump["states"]]}
+    return dump
+
+
+def _edge_label(kind: str, edge: dict) -> str:
+    if kind == "NFA":
+        if edge["type"] == "epsilon":
+            return EPSILON_LABEL
+        if edge["type"] == "any":
+            return "any"
+        return class_label(_edge_codes(edge))
+    label = edge.get("symbol", "")
+    return f"{label}/{edge['operation']}" if edge.get("operation") else label
+
+
+def to_compact(dump: dict, max_states: int | None = None) -> dict:
+    """Re-encode an automaton as an indexed graph, keeping at most `max_states` states.
+
+    States are renumbered breadth-first from the start state; `state_ids`
+    maps them back to the dump's ids. Edges are parallel `from`/`to`/`label`
+    arrays, with labels indexing the `labels` table.
+    """
+    kind = dump.get("kind")
+    if kind == "EFA" and isinstance(dump.get("nfa"), dict):
+        return {**{key: value for key, value in dump.items() if key != "nfa"}, "nfa": to_compact(dump["nfa"], max_states)}
+    edge_key = "edges" if kind == "NFA" else "transitions"
+    states = {state["id"]: state for state in dump["states"]}
+    order = _reachable(dump["start"], lambda sid: (edge["to"] for edge in states[sid][edge_key]))
+    hidden_states = len(order)
+    if max_states is not None:
+        order = order[:max_states]
+    hidden_states -= len(order)
+    renumber = {sid: i for i, sid in enumerate(order)}
+
+    labels: dict[str, int] = {}
+    sources, targets, label_ids = [], [], []
+    hidden_edges = 0
+    for sid in order:
+        for edge in states[sid][edge_key]:
+            if edge["to"] not in renumber:
+                hidden_edges += 1
+                continue
+            sources.append(renumber[sid])
+            targets.append(renumber[edge["to"]])
+            label_ids.append(labels.setdefault(_edge_label(kind, edge), len(labels)))
+    compact = {
+        "kind": kind,
+        "format": "indexed",
+        "start": 0,
+        "state_count": len(order),
+        "state_ids": order,
+        "accept": [renumber[sid] for sid in order if states[sid].get("accept")],
+        "labels": list(labels),
+        "edges": {"from": sources, "to": targets, "label": label_ids},
+        "truncated": bool(hidden_states),
+        "hidden_states": hidden_states,
+        "hidden_edges": hidden_edges,
+    }
+    for key in ("minimized", "rules", "pattern", "mismatchBudget"):
+        if key in dump:
+            compact[key] = dump[key]
+    return compact
+
+
+def process_automaton(dump: dict, view: str, max_states: int | None = None) -> dict | None:
+    """Return the requested view of a dumped automaton."""
+    if view == "none":
+        return None
+    if view == "full" or not isinstance(dump, dict) or "kind" not in dump:
+        return dump
+    if dump["kind"] == "DFA":
+        dump = minimize_dfa(dump)
+    dump = merge_parallel_edges(dump)
+    if view == "compact":
+        dump = to_compact(dump, max_states)
+    return dump
+
+
+def estimated_size(value) -> int:
+    """Approximate memory held by a JSON-like value (dicts, lists, scalars)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimated_size(key) + estimated_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimated_size(item) for item in value)
+    return size
+
+
+class AutomatonCache:
+    """Thread-safe LRU of processed automaton views, bounded by their estimated size in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value) -> None:
+        """Store a view (too large ones are skipped)."""
+        if key is None or self.max_bytes <= 0:
+            return
+        size = estimated_size(value)
+        if size > self.max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+
+
+def cache_key(payload: dict, options: dict) -> tuple | None:
+    """Cache key for a request's automaton view; None when it isn't cacheable.
+
+    The dump only depends on the mode, pattern and mismatch budget, except in
+    PDA/RNA mode where it reflects the supplied structures.
+    """
+    mode = (payload.get("mode") or "auto").lower()
+    if mode not in {"nfa", "dfa", "efa"} or payload.get("allow_dot_bracket") or payload.get("rna_mode"):
+        return None
+    return mode, payload.get("pattern", ""), payload.get("mismatch_budget"), options["view"], options["max_states"]
+
+
+AUTOMATON_CACHE = AutomatonCache(AUTOMATON_CACHE_BYTES)
+
+
+def view_and_cache(dump: dict, options: dict, key: tuple | None) -> dict | None:
+    """Process a freshly dumped automaton for the request and cache the result."""
+    view = process_automaton(dump, options["view"], options["max_states"])
+    if view is not None:
+        AUTOMATON_CACHE.put(key, view)
+    return view
+
+
+def attach_view(result: dict, cached: dict | None, options: dict, key: tuple | None) -> dict:
+    """Replace an engine result's raw `automaton` dump with the requested view.
+
+    A cached view is used as is; otherwise the dump (if the engine made one)
+    is processed and cached.
+    """
+    dump = result.pop("automaton", None)
+    view = cached if cached is not None else view_and_cache(dump, options, key) if dump is not None else None
+    if view is not None:
+        result["automaton"] = view
+    return result
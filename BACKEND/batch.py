@@ -0,0 +1,327 @@
+"""Multi-pattern batch simulation over one shared dataset.
+
+The dataset is ingested once (one temp file for the binary, one in-memory
+list for the in-process engines) and every pattern runs against it on a
+bounded worker pool. When every pattern is a plain literal, a single
+Aho-Corasick pass over the dataset replaces the per-pattern runs.
+"""
+import contextvars
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from capture import run_captured
+from config import BATCH_MAX_PATTERNS, BATCH_MAX_WORKERS, STDOUT_MEMORY_BUDGET, BackendConfigError
+from efa_engine import UnsupportedBatchError, simulate_efa_batch
+from engine import UnsupportedPatternError, simulate_in_process
+from logger import get_logger
+from parser import (
+    add_summary_statistics,
+    finalize_sequence_data,
+    new_result,
+    new_sequence_data,
+    parse_lines,
+    parse_stdout,
+    set_match_arrays,
+    set_match_ranges,
+)
+from scheduler import SCHEDULER, QueueTimeoutError, request_job
+from utils import build_command, parse_aggregation_options, read_dataset, select_backend, write_sequences_to_tempfile
+
+logger = get_logger()
+
+LITERAL_MODES = {"auto", "nfa", "dfa"}
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton over a set of literal patterns."""
+
+    def __init__(self, patterns: list[str]):
+        self.patterns = patterns
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail = [0]
+        self.depth = [0]
+        self.outputs: list[list[int]] = [[]]
+        # Trie node for every prefix of every pattern, root first.
+        self.paths: list[list[int]] = []
+        for index, pattern in enumerate(patterns):
+            node = 0
+            path = [0]
+            for ch in pattern:
+                child = self.goto[node].get(ch)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][ch] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.depth.append(self.depth[node] + 1)
+                    self.outputs.append([])
+                node = child
+                path.append(node)
+            self.outputs[node].append(index)
+            self.paths.append(path)
+
+        # Breadth-first failure links; children of the root fail to the root.
+        queue = list(self.goto[0].values())
+        while queue:
+            next_queue = []
+            for node in queue:
+                for ch, child in self.goto[node].items():
+                    if node:
+                        self.fail[child] = self._step(self.fail[node], ch)
+                    self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+                    next_queue.append(child)
+            queue = next_queue
+
+        # Nodes grouped by depth, deepest first, so occurrence counts can be
+        # pushed down failure links one level at a time.
+        depth = np.asarray(self.depth)
+        fail = np.asarray(self.fail)
+        self._levels = [
+            (nodes, fail[nodes])
+            for level in range(int(depth.max()), 0, -1)
+            for nodes in [np.flatnonzero(depth == level)]
+        ]
+
+    def _step(self, node: int, ch: str) -> int:
+        while node and ch not in self.goto[node]:
+            node = self.fail[node]
+        return self.goto[node].get(ch, 0)
+
+    def scan(self, sequence: str) -> tuple[list[list[int]], np.ndarray, int]:
+        """Return match starts per pattern, prefix occurrence counts and the final node."""
+        starts: list[list[int]] = [[] for _ in self.patterns]
+        visited = []
+        node = 0
+        for position, ch in enumerate(sequence):
+            node = self._step(node, ch)
+            visited.append(node)
+            for index in self.outputs[node]:
+                starts[index].append(position + 1 - len(self.patterns[index]))
+        occurrences = np.bincount(np.asarray(visited, dtype=np.int64), minlength=len(self.goto))
+        for nodes, parents in self._levels:
+            np.add.at(occurrences, parents, occurrences[nodes])
+        return starts, occurrences, node
+
+    def suffix_prefixes(self, final_node: int, index: int) -> int:
+        """Count non-empty suffixes of the scanned text that are prefixes of a pattern."""
+        path = self.paths[index]
+        count = 0
+        node = final_node
+        while node:
+            level = self.depth[node]
+            if level < len(path) and path[level] == node:
+                count += 1
+            node = self.fail[node]
+        return count
+
+
+def is_literal_batch(specs: list[dict]) -> bool:
+    """True when every pattern is a plain literal run in NFA/DFA semantics."""
+    return all(
+        spec["pattern"].isascii() and spec["pattern"].isalnum()
+        and spec["mode"] in LITERAL_MODES and spec.get("mismatch_budget") is None
+        for spec in specs
+    )
+
+
+def run_literal_batch(specs: list[dict], sequences: list[str], aggregation: dict | None = None) -> dict[str, dict]:
+    """Match all literal patterns in one Aho-Corasick pass per sequence.
+
+    states_visited is derived from prefix occurrence counts so it equals the
+    binary's accounting: for a start whose longest pattern prefix match has
+    length t, NFA mode visits 2t states (one fewer on a full match) and DFA
+    mode t+1 (t if the sequence ended first).
+    """
+    patterns = sorted({spec["pattern"] for spec in specs})
+    pattern_index = {pattern: index for index, pattern in enumerate(patterns)}
+    automaton = AhoCorasick(patterns)
+    scans = [automaton.scan(sequence) for sequence in sequences]
+    occurrence_matrix = np.stack([occurrences for _, occurrences, _ in scans]) if scans else np.zeros((0, 1), dtype=np.int64)
+
+    results = {}
+    for spec in specs:
+        index = pattern_index[spec["pattern"]]
+        path = automaton.paths[index]
+        pattern_length = len(spec["pattern"])
+        result = new_result()
+        result["pattern"] = spec["pattern"]
+        result["datasets"] = f"{len(sequences)} sequence(s)"
+        result["dataset_count"] = len(sequences)
+        result["automaton_mode"] = "DFA" if spec["mode"] == "dfa" else "NFA"
+        prefix_totals = occurrence_matrix[:, path[1:]].sum(axis=1).tolist()
+        total_matches = 0
+        all_accepted = True
+        for number, (sequence, (starts, _, final_node), prefix_total) in enumerate(
+            zip(sequences, scans, prefix_totals), start=1
+        ):
+            match_starts = starts[index]
+            sequence_data = new_sequence_data(number, len(sequence))
+            if aggregation is not None:
+                starts_array = np.array(match_starts, dtype=np.int64)
+                set_match_arrays(sequence_data, starts_array, starts_array + pattern_length, aggregation)
+            elif match_starts:
+                set_match_ranges(sequence_data, [f"[{start},{start + pattern_length})" for start in match_starts])
+            if match_starts:
+                sequence_data["sequence_text"] = sequence
+            if spec["mode"] == "dfa":
+                visited = prefix_total + len(sequence) - automaton.suffix_prefixes(final_node, index)
+            else:
+                visited = 2 * prefix_total - len(match_starts)
+            sequence_data["states_visited"] = visited
+            finalize_sequence_data(sequence_data)
+            result["sequences"].append(sequence_data)
+            total_matches += len(match_starts)
+            all_accepted = all_accepted and sequence == spec["pattern"]
+        result["runs"] = len(sequences)
+        result["matches"] = total_matches
+        result["all_accepted"] = all_accepted and bool(sequences)
+        results[spec["key"]] = add_summary_statistics(result)
+    return results
+
+
+def run_binary(payload: dict, dataset_path: str, aggregation: dict | None = None, requester: tuple = ({}, None)) -> dict:
+    """Run automata_sim for one pattern against the shared dataset file.
+
+    `requester` is the request's (headers, remote address); each run is
+    scheduled as its own job for that client.
+    """
+    cmd = build_command(payload, dataset_path)
+    job = request_job(payload, dataset_path, *requester)
+    try:
+        with SCHEDULER.slot(job):
+            completed = run_captured(cmd, STDOUT_MEMORY_BUDGET, timeout=30)
+    except QueueTimeoutError as exc:
+        return {"error": str(exc)}
+    except subprocess.TimeoutExpired:
+        return {"error": "Simulation timed out (>30s)"}
+    with completed.stdout:
+        if completed.returncode != 0:
+            return {
+                "error": "Simulation failed",
+                "stderr": completed.stderr,
+                "returncode": completed.returncode,
+            }
+        return parse_lines(completed.stdout.lines(), aggregation)
+
+
+def run_pattern(
+    spec: dict,
+    sequences: list[str] | None,
+    dataset_path: str,
+    aggregation: dict | None = None,
+    requester: tuple = ({}, None),
+) -> dict:
+    """Run one pattern on the cheapest backend that can serve it."""
+    payload = {
+        "pattern": spec["pattern"],
+        "mode": spec["mode"],
+        "mismatch_budget": spec.get("mismatch_budget"),
+        "sequences": sequences or [],
+        "backend": spec.get("backend", "auto"),
+    }
+    try:
+        backend = select_backend(payload)
+        if backend == "inprocess":
+            stdout, _ = simulate_in_process(payload, dump_automaton=False)
+            return parse_stdout(stdout, aggregation)
+        if backend == "bitparallel":
+            return simulate_efa_batch(payload, aggregation, dump_automaton=False)
+    except (UnsupportedPatternError, UnsupportedBatchError) as exc:
+        logger.debug(f"Batch pattern {spec['pattern']!r} falls back to the binary: {exc}")
+    except BackendConfigError as exc:
+        return {"error": str(exc)}
+    payload["sequences"] = []
+    try:
+        return run_binary(payload, dataset_path, aggregation, requester)
+    except BackendConfigError as exc:
+        return {"error": str(exc)}
+
+
+def normalize_specs(body: dict) -> list[dict]:
+    """Validate the batch request's pattern list and fill in per-pattern defaults."""
+    raw_patterns = body.get("patterns")
+    if not isinstance(raw_patterns, list) or not raw_patterns:
+        raise BackendConfigError("'patterns' must be a non-empty list.")
+    if len(raw_patterns) > BATCH_MAX_PATTERNS:
+        raise BackendConfigError(f"At most {BATCH_MAX_PATTERNS} patterns per batch.")
+
+    specs = []
+    seen = set()
+    for raw in raw_patterns:
+        spec = {"pattern": raw} if isinstance(raw, str) else dict(raw) if isinstance(raw, dict) else None
+        if spec is None or not isinstance(spec.get("pattern"), str) or not spec["pattern"]:
+            raise BackendConfigError("Each pattern must be a non-empty string or an object with 'pattern'.")
+        spec["mode"] = str(spec.get("mode", body.get("mode", "auto"))).lower()
+        if spec["mode"] not in {"auto", "nfa", "dfa", "efa"}:
+            raise BackendConfigError(f"Unsupported batch mode '{spec['mode']}'.")
+        budget = spec.get("mismatch_budget", body.get("mismatch_budget"))
+        if budget is not None and not isinstance(budget, int):
+            raise BackendConfigError("'mismatch_budget' must be an integer.")
+        spec["mismatch_budget"] = budget
+        spec["key"] = str(spec.get("id", spec["pattern"]))
+        if spec["key"] in seen:
+            raise BackendConfigError(f"Duplicate batch key '{spec['key']}'; give repeated patterns an 'id'.")
+        seen.add(spec["key"])
+        specs.append(spec)
+    return specs
+
+
+def run_batch(body: dict, headers=None, remote_addr: str | None = None) -> dict:
+    """Run every pattern in a batch request against one shared dataset.
+
+    `headers` and `remote_addr` identify the client and priority class for
+    the scheduler (see scheduler.request_job).
+    """
+    requester = (headers or {}, remote_addr)
+    specs = normalize_specs(body)
+    aggregation = parse_aggregation_options(body)
+    input_path = body.get("input_path")
+    inline = body.get("sequences") or []
+    if not isinstance(inline, list) or not all(isinstance(seq, str) for seq in inline):
+        raise BackendConfigError("'sequences' must be a list of strings.")
+    if input_path is not None and not isinstance(input_path, str):
+        raise BackendConfigError("'input_path' must be a string.")
+    if not input_path and not inline:
+        raise BackendConfigError("Provide 'sequences' or 'input_path'.")
+
+    sequences = None
+    temp_dataset_path = None
+    if input_path:
+        dataset_path = input_path
+    else:
+        sequences = [seq.strip() for seq in inline if seq.strip()]
+        temp_dataset_path = write_sequences_to_tempfile(sequences)
+        dataset_path = temp_dataset_path
+
+    try:
+        if body.get("multi_pattern", True) and is_literal_batch(specs):
+            if sequences is None and os.path.exists(input_path):
+                sequences = read_dataset(input_path)
+            if sequences and all(seq.isascii() for seq in sequences):
+                return {
+                    "engine": "aho-corasick",
+                    "dataset_count": len(sequences),
+                    "pattern_count": len(specs),
+                    "results": run_literal_batch(specs, sequences, aggregation),
+                }
+
+        workers = max(1, min(BATCH_MAX_WORKERS, len(specs)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Workers run in a copy of the request's context so their log
+            # records keep its trace ID.
+            context = contextvars.copy_context()
+            outputs = list(pool.map(
+                lambda spec: context.copy().run(run_pattern, spec, sequences, dataset_path, aggregation, requester), specs
+            ))
+        return {
+            "engine": "per-pattern",
+            "dataset_count": len(sequences) if sequences is not None else None,
+            "pattern_count": len(specs),
+            "results": {spec["key"]: output for spec, output in zip(specs, outputs)},
+        }
+    finally:
+        if temp_dataset_path and os.path.exists(temp_dataset_path):
+            os.unlink(temp_dataset_path)
@@ -0,0 +1,75 @@
+"""Generate binary_manifest.json for fast cold starts.
+
+Run at build time (and whenever automata_sim is rebuilt):
+
+    python BACKEND/build_manifest.py
+
+Records where the binary lives relative to BACKEND and which features it
+supports, so serverless functions don't have to probe for it on startup.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from config import BASE_DIR, MANIFEST_PATH, _resolve_binary_path  # noqa: E402
+
+# One small run per mode; a mode is supported if the binary exits cleanly.
+MODE_PROBES = {
+    "nfa": ["--pattern", "AC", "--mode", "nfa"],
+    "dfa": ["--pattern", "AC", "--mode", "dfa"],
+    "efa": ["--pattern", "AC", "--mode", "efa", "--k", "1"],
+    "pda": ["--pattern", "AC", "--mode", "pda"],
+}
+
+
+def probe(binary: Path, args: list[str], dataset: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [str(binary), *args, "--input", dataset],
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        check=False,
+        timeout=10,
+    )
+
+
+def build_manifest() -> dict:
+    binary = _resolve_binary_path()
+    if not binary.exists():
+        raise SystemExit(f"automata_sim not found at {binary}")
+    if platform.system() != "Windows" and not os.access(binary, os.X_OK):
+        os.chmod(binary, binary.stat().st_mode | 0o111)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = os.path.join(tmp, "probe.txt")
+        with open(dataset, "w", encoding="utf-8") as f:
+            f.write("ACGT\n")
+        modes = [mode for mode, args in MODE_PROBES.items() if probe(binary, args, dataset).returncode == 0]
+        dump_path = os.path.join(tmp, "dump.json")
+        dumped = probe(binary, MODE_PROBES["nfa"] + ["--dump-automaton", dump_path], dataset)
+        dump_automaton = dumped.returncode == 0 and os.path.exists(dump_path) and os.path.getsize(dump_path) > 0
+
+    return {
+        "binary": os.path.relpath(binary, BASE_DIR),
+        "platform": platform.system(),
+        "size": binary.stat().st_size,
+        "capabilities": {
+            "dump_automaton": dump_automaton,
+            "modes": modes,
+        },
+    }
+
+
+if __name__ == "__main__":
+    manifest = build_manifest()
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    print(f"Wrote {MANIFEST_PATH}: {json.dumps(manifest)}")
@@ -0,0 +1,215 @@
+"""Bounded-memory capture of simulator stdout.
+
+Output is buffered in memory up to a per-request budget; past that it is
+spooled to a temporary file and read back through mmap, one line at a time,
+so large results are never held as a single decoded string.
+"""
+import mmap
+import os
+import subprocess
+import tempfile
+import threading
+from collections.abc import Sequence
+
+from config import STDOUT_MEMORY_BUDGET, STDOUT_MEMORY_BUDGET_MAX, BackendConfigError
+from spawner import popen
+
+CHUNK_SIZE = 1 << 20
+_WHITESPACE = b" \t\n\r\x0b\x0c"
+
+
+class MappedLines(Sequence):
+    """Lines of a byte buffer (e.g. an mmap), decoded on access.
+
+    Behaves like `text.strip().split("\\n")` on the decoded buffer, but only
+    keeps the newline offsets in memory.
+    """
+
+    def __init__(self, data):
+        # Only spilled output needs NumPy; keep it off the import path.
+        import numpy as np
+
+        self._data = data
+        begin, end = 0, len(data)
+        while begin < end and data[begin] in _WHITESPACE:
+            begin += 1
+        while end > begin and data[end - 1] in _WHITESPACE:
+            end -= 1
+        view = np.frombuffer(data, dtype=np.uint8)
+        newlines = [
+            np.flatnonzero(view[offset:min(offset + CHUNK_SIZE, end)] == 0x0A) + offset
+            for offset in range(begin, end, CHUNK_SIZE)
+        ]
+        breaks = np.concatenate(newlines) if newlines else np.empty(0, dtype=np.int64)
+        self._starts = np.concatenate(([begin], breaks + 1))
+        self._ends = np.concatenate((breaks, [end]))
+        self._cached = (None, None)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        # The parser looks at the same line several times in a row.
+        if self._cached[0] == index:
+            return self._cached[1]
+        line = bytes(self._data[self._starts[index]:self._ends[index]]).decode("utf-8", errors="replace")
+        if line.endswith("\r"):
+            # Match the newline translation of text-mode subprocess output.
+            line = line[:-1]
+        self._cached = (index, line)
+        return line
+
+
+class CapturedOutput:
+    """Simulator stdout held in memory or in a spool file."""
+
+    def __init__(self, memory_budget: int):
+        self.memory_budget = memory_budget
+        self.size = 0
+        self.peak_buffered = 0
+        self._buffer = bytearray()
+        self._spool = None
+        self._spool_path = None
+        self._map = None
+
+    @property
+    def spooled(self) -> bool:
+        return self._spool_path is not None
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self._spool is None and len(self._buffer) + len(chunk) > self.memory_budget:
+            fd, self._spool_path = tempfile.mkstemp(suffix=".stdout")
+            self._spool = os.fdopen(fd, "w+b")
+            self._spool.write(self._buffer)
+            self._buffer = bytearray()
+        if self._spool is not None:
+            self._spool.write(chunk)
+            self.peak_buffered = max(self.peak_buffered, len(chunk))
+        else:
+            self._buffer += chunk
+            self.peak_buffered = max(self.peak_buffered, len(self._buffer))
+
+    def lines(self) -> Sequence[str]:
+        """Return the stripped output lines for parse_lines."""
+        if not self.spooled:
+            text = self._buffer.decode("utf-8", errors="replace").replace("\r\n", "\n")
+            return text.strip().split("\n")
+        if self._map is None:
+            self._spool.flush()
+            if not self.size:
+                return [""]
+            self._map = mmap.mmap(self._spool.fileno(), 0, access=mmap.ACCESS_READ)
+        return MappedLines(self._map)
+
+    def head(self, limit: int) -> str:
+        """Return roughly the first `limit` characters, for logs and error responses."""
+        if self.spooled:
+            self._spool.flush()
+            self._spool.seek(0)
+            data = self._spool.read(limit * 4)
+        else:
+            data = bytes(self._buffer[:limit * 4])
+        return data.decode("utf-8", errors="replace")[:limit]
+
+    def metrics(self) -> dict:
+        return {
+            "stdout_bytes": self.size,
+            "stdout_spooled": self.spooled,
+            "memory_budget": self.memory_budget,
+            "peak_buffered_bytes": self.peak_buffered,
+        }
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        if self._spool_path and os.path.exists(self._spool_path):
+            os.unlink(self._spool_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def cached_metrics(memory_budget: int) -> dict:
+    """`metrics` for a response served from the result cache: nothing was captured."""
+    return {
+        "stdout_bytes": 0,
+        "stdout_spooled": False,
+        "memory_budget": memory_budget,
+        "peak_buffered_bytes": 0,
+        "result_cache": "hit",
+    }
+
+
+def resolve_memory_budget(value: int | None) -> int:
+    """Return the stdout memory budget for a request, validating an explicit one."""
+    if value is None:
+        return STDOUT_MEMORY_BUDGET
+    if not 0 <= value <= STDOUT_MEMORY_BUDGET_MAX:
+        raise BackendConfigError(f"'memory_budget' must be between 0 and {STDOUT_MEMORY_BUDGET_MAX} bytes.")
+    return value
+
+
+def run_captured(
+    cmd: list[str], memory_budget: int, timeout: float | None = None, on_start=None
+) -> subprocess.CompletedProcess:
+    """Run a command like subprocess.run(capture_output=True, text=True).
+
+    stdout is a CapturedOutput that holds at most `memory_budget` bytes in
+    memory (callers must close it); stderr is decoded text. Raises
+    subprocess.TimeoutExpired after killing the process on timeout.
+    `on_start(process)` is called once the process runs, e.g. to register it
+    for cancellation.
+    """
+    # Through the spawn helper when app.py started one (see spawner.py).
+    process = popen(cmd)
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.start()
+    if on_start is not None:
+        on_start(process)
+    output = CapturedOutput(memory_budget)
+    # Small budgets read in small chunks so a chunk never dwarfs the budget.
+    chunk_size = min(CHUNK_SIZE, max(memory_budget, 4096))
+    try:
+        while chunk := process.stdout.read(chunk_size):
+            output.write(chunk)
+        process.wait()
+        stderr_reader.join()
+    except BaseException:
+        process.kill()
+        output.close()
+        raise
+    finally:
+        if timer:
+            timer.cancel()
+        process.stdout.close()
+        process.stderr.close()
+    if timed_out.is_set():
+        output.close()
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    stderr = b"".join(stderr_chunks).decode("utf-8", errors="replace")
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout=output, stderr=stderr)
@@ -0,0 +1,98 @@
+"""Latest-wins supersession of /simulate requests on a client channel.
+
+The web UI re-runs /simulate as the user types, and only the newest result is
+used. A request that names a channel (`X-Channel` header or `channel` option)
+claims it. Claiming a channel supersedes the previous request on it: its
+queued scheduler job is dropped, and its running simulator process is killed.
+The superseded request answers 409 right away.
+
+With CHANNEL_DEBOUNCE_MS set, a claimed request first waits that long, and
+gives up if a newer one arrives meanwhile. A burst of keystrokes then costs
+one simulation.
+
+Channels are scoped per client (X-API-Key, else remote address), so clients
+can't cancel each other's requests.
+"""
+import threading
+
+from config import CHANNEL_DEBOUNCE_MS
+
+
+class SupersededError(RuntimeError):
+    """Raised when a newer request has claimed the same channel."""
+
+    def __init__(self):
+        super().__init__("Superseded by a newer request on the same channel.")
+
+
+class Ticket:
+    """One request's claim on a channel."""
+
+    __slots__ = ("key", "_superseded", "_callbacks", "_lock")
+
+    def __init__(self, key: tuple[str, str]):
+        self.key = key
+        self._superseded = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def superseded(self) -> bool:
+        return self._superseded.is_set()
+
+    def on_cancel(self, callback) -> None:
+        """Call `callback()` when superseded (at once if it already is)."""
+        with self._lock:
+            if not self._superseded.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def supersede(self) -> None:
+        with self._lock:
+            if self._superseded.is_set():
+                return
+            self._superseded.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def settle(self, seconds: float | None = None) -> None:
+        """Wait out the debounce window; raise SupersededError if superseded."""
+        seconds = CHANNEL_DEBOUNCE_MS / 1000 if seconds is None else seconds
+        if seconds > 0:
+            self._superseded.wait(seconds)
+        if self.superseded:
+            raise SupersededError()
+
+
+class ChannelRegistry:
+    """The current ticket of every active channel."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current: dict[tuple[str, str], Ticket] = {}
+        self.superseded = 0
+
+    def claim(self, client: str, channel: str) -> Ticket:
+        ticket = Ticket((client, channel))
+        with self._lock:
+            previous = self._current.get(ticket.key)
+            self._current[ticket.key] = ticket
+        if previous is not None and not previous.superseded:
+            previous.supersede()
+            with self._lock:
+                self.superseded += 1
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        with self._lock:
+            if self._current.get(ticket.key) is ticket:
+                del self._current[ticket.key]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"active": len(self._current), "superseded": self.superseded}
+
+
+CHANNELS = ChannelRegistry()
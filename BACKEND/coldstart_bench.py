@@ -0,0 +1,85 @@
+"""Cold-start benchmark for the serverless entry point (api/simulate.py).
+
+    python BACKEND/coldstart_bench.py [--runs 15]
+
+Each run starts a fresh interpreter, imports the function module and serves
+one request through Flask's test client, like a cold Vercel container. The
+"eager" variant also imports the NumPy-backed modules up front, which is what
+the entry point used to do. The binary check and path resolution are timed in
+process, per call.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import timeit
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+API_DIR = BACKEND_DIR.parent / "api"
+
+COLD_START = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {api_dir!r})
+{eager}
+import simulate
+imported = time.perf_counter()
+response = simulate.app.test_client().get("/api/simulate?mode=nfa&pattern=A(C|G)*T&sequences=ACGTAGT&backend=binary")
+assert response.status_code == 200, response.get_data(as_text=True)
+served = time.perf_counter()
+print(json.dumps({{"import_ms": (imported - start) * 1000, "first_request_ms": (served - imported) * 1000}}))
+"""
+
+EAGER_IMPORTS = f"sys.path.insert(0, {str(BACKEND_DIR)!r}); import numpy, aggregate, batch, capture, efa_engine, pda_validator"
+
+
+def cold_start(eager: bool) -> dict:
+    code = COLD_START.format(api_dir=str(API_DIR), eager=EAGER_IMPORTS if eager else "")
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples: list[dict]) -> dict:
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=15)
+    args = parser.parse_args()
+
+    results = {}
+    for name, eager in (("eager", True), ("lazy", False)):
+        results[name] = summarize([cold_start(eager) for _ in range(args.runs)])
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    import config
+
+    def check_every_time():
+        config._binary_checked = False
+        config.ensure_binary_available()
+
+    calls = 2000
+    per_request_check = timeit.timeit(check_every_time, number=calls) / calls * 1e6
+    once_per_container = timeit.timeit(config.ensure_binary_available, number=calls) / calls * 1e6
+    probe_paths = timeit.timeit(config._resolve_binary_path, number=calls) / calls * 1e6
+    read_manifest = timeit.timeit(config.load_binary_manifest, number=calls) / calls * 1e6
+
+    print(f"Cold start, median of {args.runs} fresh interpreters:")
+    for name, result in results.items():
+        print(f"  {name:5}  import {result['import_ms']:7.1f} ms   first request {result['first_request_ms']:6.1f} ms")
+    saved = results["eager"]["import_ms"] - results["lazy"]["import_ms"]
+    print(f"  lazy imports save {saved:.1f} ms ({saved / results['eager']['import_ms']:.0%}) of import time")
+    print("Binary check per request:")
+    print(f"  stat + chmod check every call  {per_request_check:7.2f} us")
+    print(f"  once per container             {once_per_container:7.2f} us")
+    print("Binary location at import:")
+    print(f"  probe candidate paths          {probe_paths:7.2f} us")
+    print(f"  read manifest                  {read_manifest:7.2f} us"
+          + ("" if config.BINARY_MANIFEST else "  (no valid manifest; run build_manifest.py)"))
+
+
+if __name__ == "__main__":
+    main()
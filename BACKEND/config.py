@@ -1,4 +1,5 @@
 """Configuration module for automata simulator API."""
+import json
 import os
 import platform
 from pathlib import Path
@@ -30,15 +31,139 @@ def _resolve_binary_path() -> Path:
             return Path(p)
     return AUTOMATA_SIM_PATH
 
-AUTOMATA_SIM_PATH = _resolve_binary_path()
+# Written by build_manifest.py at build time: where the binary is (relative to
+# BACKEND) and what it supports, so cold starts skip probing for it.
+MANIFEST_PATH = BASE_DIR / "binary_manifest.json"
+
+
+def load_binary_manifest() -> dict | None:
+    """Return the build-time binary manifest if it still matches the binary on disk."""
+    if "AUTOMATA_SIM_PATH" in os.environ:
+        return None
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        binary = BASE_DIR / manifest["binary"]
+        if manifest.get("platform") != platform.system() or binary.stat().st_size != manifest.get("size"):
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    manifest["path"] = binary
+    return manifest
+
+
+BINARY_MANIFEST = load_binary_manifest()
+AUTOMATA_SIM_PATH = BINARY_MANIFEST["path"] if BINARY_MANIFEST else _resolve_binary_path()
+
+# Requests whose estimated cost (see utils.estimate_request_cost) is at or below
+# this threshold are simulated in process instead of spawning the binary.
+# Set to 0 to always use the binary.
+IN_PROCESS_MAX_COST = int(os.environ.get("IN_PROCESS_MAX_COST", "50000"))
+# The in-process engine's subset DFA can grow exponentially with the pattern
+# (e.g. (A|C)*A(A|C)(A|C)...). Patterns needing more states than this go to
+# the binary instead, whatever the sequence cost.
+IN_PROCESS_MAX_DFA_STATES = max(1, int(os.environ.get("IN_PROCESS_MAX_DFA_STATES", "256")))
+
+# EFA requests whose inline reads are all at most this long are matched with the
+# bit-parallel batch engine when the backend is left on "auto".
+EFA_BATCH_MAX_READ_LENGTH = int(os.environ.get("EFA_BATCH_MAX_READ_LENGTH", "1000"))
+
+# /simulate/batch limits: patterns per request and concurrent simulator runs.
+BATCH_MAX_PATTERNS = int(os.environ.get("BATCH_MAX_PATTERNS", "1000"))
+BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Simulator stdout is buffered in memory up to this many bytes per request,
+# then spooled to a temp file and parsed through mmap. Requests may ask for a
+# different budget with `memory_budget`, up to STDOUT_MEMORY_BUDGET_MAX.
+STDOUT_MEMORY_BUDGET = int(os.environ.get("STDOUT_MEMORY_BUDGET", str(16 * 1024 * 1024)))
+STDOUT_MEMORY_BUDGET_MAX = int(os.environ.get("STDOUT_MEMORY_BUDGET_MAX", str(256 * 1024 * 1024)))
+
+
+# Simulator runs are scheduled shortest-job-first over this many slots (see
+# scheduler.py). Batch jobs are promoted after SCHEDULER_BATCH_MAX_WAIT seconds;
+# a job's score halves every SCHEDULER_AGING_SECONDS it waits; requests give up
+# with 503 after SCHEDULER_QUEUE_TIMEOUT seconds in the queue.
+SCHEDULER_WORKERS = int(os.environ.get("SCHEDULER_WORKERS", str(os.cpu_count() or 1)))
+SCHEDULER_AGING_SECONDS = float(os.environ.get("SCHEDULER_AGING_SECONDS", "5"))
+SCHEDULER_BATCH_MAX_WAIT = float(os.environ.get("SCHEDULER_BATCH_MAX_WAIT", "60"))
+SCHEDULER_QUEUE_TIMEOUT = float(os.environ.get("SCHEDULER_QUEUE_TIMEOUT", "120"))
+# Slots batch jobs may not take; default one when there is more than one slot.
+SCHEDULER_RESERVED_SLOTS = int(os.environ.get("SCHEDULER_RESERVED_SLOTS", "1" if SCHEDULER_WORKERS > 1 else "0"))
+# Requests without an X-Priority header are interactive up to this estimated
+# size (sequence bytes weighted by mode, see scheduler.estimate_job_size).
+SCHEDULER_INTERACTIVE_MAX_SIZE = float(os.environ.get("SCHEDULER_INTERACTIVE_MAX_SIZE", "200000"))
+# Comma-separated X-API-Key values of pipelines; their jobs always run as batch.
+SCHEDULER_BATCH_API_KEYS = frozenset(
+    key.strip() for key in os.environ.get("SCHEDULER_BATCH_API_KEYS", "").split(",") if key.strip()
+)
+
+# Streaming sessions (see stream.py). Per-session options may lower the batch
+# and buffer limits but not raise them.
+STREAM_MAX_SESSIONS = int(os.environ.get("STREAM_MAX_SESSIONS", "64"))
+STREAM_IDLE_TIMEOUT = float(os.environ.get("STREAM_IDLE_TIMEOUT", "300"))
+STREAM_BATCH_MAX_SEQUENCES = int(os.environ.get("STREAM_BATCH_MAX_SEQUENCES", "256"))
+STREAM_BATCH_MAX_BYTES = int(os.environ.get("STREAM_BATCH_MAX_BYTES", str(1024 * 1024)))
+STREAM_FLUSH_INTERVAL_MS = int(os.environ.get("STREAM_FLUSH_INTERVAL_MS", "200"))
+STREAM_WINDOW = int(os.environ.get("STREAM_WINDOW", "256"))
+STREAM_WINDOW_MAX = int(os.environ.get("STREAM_WINDOW_MAX", str(64 * 1024)))
+STREAM_MAX_PENDING_BYTES = int(os.environ.get("STREAM_MAX_PENDING_BYTES", str(8 * 1024 * 1024)))
+STREAM_MAX_PENDING_EVENTS = int(os.environ.get("STREAM_MAX_PENDING_EVENTS", "1024"))
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get("STREAM_HEARTBEAT_SECONDS", "15"))
+
+# Byte budget for processed automaton views kept in memory (see
+# automaton_view.py); 0 disables the cache.
+AUTOMATON_CACHE_BYTES = int(os.environ.get("AUTOMATON_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+# Byte budget for packed binary results kept for repeat queries (see packed.py);
+# 0 disables the cache.
+RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# Launch the binary through a pre-started spawn helper (see spawner.py) instead
+# of forking the worker: "1", "0", or "auto" (only where subprocess.Popen would
+# fork; on Linux it uses vfork from Python 3.10). Only app.py starts it.
+SPAWN_HELPER_MODE = os.environ.get("SPAWN_HELPER", "auto").lower()
+
+# Requests on a channel (see channels.py) wait this long before running, and
+# are dropped if a newer request on the same channel arrives meanwhile.
+CHANNEL_DEBOUNCE_MS = int(os.environ.get("CHANNEL_DEBOUNCE_MS", "0"))
+
+# Consistent-hash router in front of several app.py instances (see router.py).
+ROUTER_BACKENDS = [url.strip() for url in os.environ.get("ROUTER_BACKENDS", "").split(",") if url.strip()]
+ROUTER_VNODES = int(os.environ.get("ROUTER_VNODES", "128"))
+ROUTER_HEALTH_INTERVAL = float(os.environ.get("ROUTER_HEALTH_INTERVAL", "2"))
+ROUTER_MAX_IN_FLIGHT = int(os.environ.get("ROUTER_MAX_IN_FLIGHT", "8"))
+ROUTER_CONNECT_TIMEOUT = float(os.environ.get("ROUTER_CONNECT_TIMEOUT", "5"))
+# A backend may hold a request for its whole queue wait plus the binary's 30 s
+# run (and parsing), so the default read timeout outlasts both.
+ROUTER_READ_TIMEOUT = float(os.environ.get("ROUTER_READ_TIMEOUT", str(SCHEDULER_QUEUE_TIMEOUT + 60)))
+# Behind router.py (or another proxy), take the client address from
+# X-Forwarded-For. Only enable it when clients can't reach the app directly.
+TRUST_PROXY_HEADERS = os.environ.get("TRUST_PROXY_HEADERS", "").lower() in ("true", "1", "yes")
 
 
 class BackendConfigError(RuntimeError):
     """Exception raised for configuration errors."""
 
 
+_binary_checked = False
+
+
+def binary_supports(capability: str) -> bool:
+    """Whether the binary supports a feature, per the manifest (assumed yes without one)."""
+    if not BINARY_MANIFEST:
+        return True
+    return bool(BINARY_MANIFEST.get("capabilities", {}).get(capability, True))
+
+
 def ensure_binary_available() -> None:
-    """Ensure the automata simulator binary is available."""
+    """Ensure the automata simulator binary is available.
+
+    The check (and chmod) runs once per process; later calls return
+    immediately. A missing binary is re-checked on every call.
+    """
+    global _binary_checked
+    if _binary_checked:
+        return
     if not AUTOMATA_SIM_PATH.exists():
         binary_name = "automata_sim.exe" if platform.system() == "Windows" else "automata_sim"
         other_binary = BASE_DIR / ("automata_sim.exe" if platform.system() != "Windows" else "automata_sim")
@@ -68,4 +193,5 @@ def ensure_binary_available() -> None:
             except (OSError, PermissionError):
                 # If we can't set permissions, it might work anyway
                 pass
+    _binary_checked = True
 
@@ -0,0 +1,180 @@
+"""Batched bit-parallel approximate matcher for EFA mismatch-budget requests.
+
+Runs shift-and with a mismatch budget (Hamming distance, like the binary's EFA
+mode) over many sequences at once: sequences are packed into a padded byte
+matrix and every column step updates the bit vectors of all rows with NumPy.
+Results are built in the same shape parse_stdout produces for EFA runs.
+"""
+import numpy as np
+
+from engine import compile_pattern
+from parser import (
+    add_summary_statistics,
+    finalize_sequence_data,
+    new_result,
+    new_sequence_data,
+    set_match_arrays,
+    set_match_ranges,
+)
+
+# Bit vectors are held in uint64, one bit per pattern position.
+MAX_PATTERN_LENGTH = 64
+
+_ANY = "."
+
+
+class UnsupportedBatchError(ValueError):
+    """Raised when a request can't be served by the bit-parallel EFA engine."""
+
+
+def _pattern_masks(pattern: str) -> np.ndarray:
+    """Return the per-byte match masks: bit t of masks[c] is set if pattern[t] accepts c."""
+    masks = np.zeros(256, dtype=np.uint64)
+    for position, symbol in enumerate(pattern):
+        bit = np.uint64(1 << position)
+        if symbol == _ANY:
+            masks |= bit
+        else:
+            masks[ord(symbol)] |= bit
+    return masks
+
+
+def _encode(sequences: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pack sequences into a zero-padded byte matrix ordered by decreasing length.
+
+    Ordering by length keeps the rows that are still being scanned at any column
+    a contiguous prefix, so each step only touches live rows.
+    """
+    lengths = np.fromiter((len(seq) for seq in sequences), dtype=np.int64, count=len(sequences))
+    order = np.argsort(-lengths, kind="stable")
+    width = int(lengths.max()) if len(sequences) else 0
+    codes = np.zeros((len(sequences), width), dtype=np.uint8)
+    for row, index in enumerate(order):
+        seq = sequences[index]
+        codes[row, :len(seq)] = np.frombuffer(seq.encode("ascii"), dtype=np.uint8)
+    return codes, lengths[order], order
+
+
+def match_batch(pattern: str, mismatch_budget: int, sequences: list[str]) -> tuple[list[list[tuple[int, int]]], np.ndarray]:
+    """Find all windows within the mismatch budget for every sequence.
+
+    Returns per-sequence lists of [start,end) ranges (sorted by start) and the
+    states visited count per sequence, matching the binary's EFA accounting.
+    """
+    m = len(pattern)
+    masks = _pattern_masks(pattern)
+    codes, lengths, order = _encode(sequences)
+    rows = len(sequences)
+    # A window has at most m mismatches, so budgets past m match the same
+    # windows; clamping keeps a large request-supplied budget from sizing R.
+    mismatch_budget = min(mismatch_budget, m)
+    levels = mismatch_budget + 1
+
+    one = np.uint64(1)
+    accept_shift = np.uint64(m - 1)
+    prefix_mask = np.uint64((1 << m) - 1)
+    # R[d] bit t: the last t+1 characters match pattern[:t+1] with at most d mismatches.
+    R = np.zeros((levels, rows), dtype=np.uint64)
+    visited = np.zeros(rows, dtype=np.int64)
+    hit_rows = []
+    hit_ends = []
+
+    live = rows
+    for column in range(codes.shape[1]):
+        while live and lengths[live - 1] <= column:
+            live -= 1
+        eq = masks[codes[:live, column]]
+        shifted_prev = None
+        for d in range(levels):
+            shifted = (R[d, :live] << one) | one
+            updated = shifted & eq
+            if shifted_prev is not None:
+                updated |= shifted_prev
+            shifted_prev = shifted
+            R[d, :live] = updated
+
+        final = R[mismatch_budget, :live]
+        accepted = (final >> accept_shift) & one
+        # Every active prefix is two NFA states (literal + epsilon), except the
+        # accept state reached after the last pattern symbol.
+        visited[:live] += 2 * np.bitwise_count(final & prefix_mask).astype(np.int64) - accepted.astype(np.int64)
+        hits = np.flatnonzero(accepted)
+        if hits.size:
+            hit_rows.append(hits)
+            hit_ends.append(np.full(hits.size, column + 1, dtype=np.int64))
+
+    ranges: list[list[tuple[int, int]]] = [[] for _ in range(rows)]
+    if hit_rows:
+        all_rows = np.concatenate(hit_rows)
+        all_ends = np.concatenate(hit_ends)
+        for row, end in zip(order[all_rows].tolist(), all_ends.tolist()):
+            ranges[row].append((end - m, end))
+
+    states_visited = np.empty(rows, dtype=np.int64)
+    states_visited[order] = visited
+    return ranges, states_visited
+
+
+def simulate_efa_batch(payload: dict, aggregation: dict | None = None, dump_automaton: bool = True) -> dict:
+    """Simulate an inline-sequence EFA request and return a parse_stdout-shaped result.
+
+    Aggregation options summarize the matches like parse_stdout does. The
+    automaton dump is left out unless `dump_automaton` is set.
+
+    Raises UnsupportedBatchError when the request must go through the binary.
+    """
+    pattern = payload.get("pattern", "")
+    mismatch_budget = payload.get("mismatch_budget") or 0
+    if payload.get("mode", "auto").lower() != "efa":
+        raise UnsupportedBatchError("Bit-parallel engine only handles EFA mode.")
+    if not pattern or len(pattern) > MAX_PATTERN_LENGTH:
+        raise UnsupportedBatchError(f"Pattern length must be between 1 and {MAX_PATTERN_LENGTH}.")
+    if not all(symbol.isalnum() and symbol.isascii() or symbol == _ANY for symbol in pattern):
+        raise UnsupportedBatchError("Bit-parallel engine only handles literal patterns and '.'.")
+    if mismatch_budget < 0:
+        raise UnsupportedBatchError("Negative mismatch budget.")
+
+    sequences = [seq.strip() for seq in payload.get("sequences") or [] if seq.strip()]
+    if not sequences or not all(seq.isascii() for seq in sequences):
+        raise UnsupportedBatchError("Bit-parallel engine needs inline ASCII sequences.")
+
+    ranges, states_visited = match_batch(pattern, mismatch_budget, sequences)
+
+    result = new_result()
+    result["pattern"] = pattern
+    result["datasets"] = f"{len(sequences)} sequence(s)"
+    result["dataset_count"] = len(sequences)
+    result["automaton_mode"] = "EFA"
+    for number, (sequence, seq_ranges, visited) in enumerate(zip(sequences, ranges, states_visited.tolist()), start=1):
+        sequence_data = new_sequence_data(number, len(sequence))
+        if aggregation is not None:
+            bounds = np.array(seq_ranges, dtype=np.int64).reshape(-1, 2)
+            set_match_arrays(sequence_data, bounds[:, 0], bounds[:, 1], aggregation)
+        elif seq_ranges:
+            set_match_ranges(sequence_data, [f"[{start},{end})" for start, end in seq_ranges])
+        if seq_ranges:
+            # The binary only prints the sequence text when something matched.
+            sequence_data["sequence_text"] = sequence
+        sequence_data["states_visited"] = visited
+        finalize_sequence_data(sequence_data)
+        result["sequences"].append(sequence_data)
+
+    result["runs"] = len(sequences)
+    result["matches"] = sum(len(seq_ranges) for seq_ranges in ranges)
+    result["all_accepted"] = all(
+        (0, len(sequence)) in seq_ranges for sequence, seq_ranges in zip(sequences, ranges)
+    )
+    result = add_summary_statistics(result)
+    if dump_automaton:
+        result["automaton"] = efa_automaton_dump(pattern, mismatch_budget)
+    return result
+
+
+def efa_automaton_dump(pattern: str, mismatch_budget: int) -> dict:
+    """Return the automaton in the binary's EFA --dump-automaton JSON shape."""
+    return {
+        "kind": "EFA",
+        "pattern": pattern,
+        "mismatchBudget": mismatch_budget,
+        "nfa": compile_pattern(pattern).dump("nfa"),
+    }
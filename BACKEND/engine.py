@@ -0,0 +1,286 @@
+"""In-process NFA/DFA engine for small simulation requests.
+
+Mirrors the Thompson construction and scanning strategy of automata_sim so that
+match ranges, states visited counts and automaton dumps are identical to the
+binary's, without paying for a process spawn on requests that only need a few
+microseconds of matching.
+"""
+import string
+from functools import lru_cache
+
+from config import IN_PROCESS_MAX_DFA_STATES
+
+IN_PROCESS_MODES = {"nfa", "dfa"}
+
+_LITERAL_CHARS = frozenset(string.ascii_letters + string.digits)
+_ANY = "."
+_CONCAT = "\x00"
+_PRECEDENCE = {"|": 1, _CONCAT: 2}
+_POSTFIX_OPERATORS = {"*", "+", "?"}
+_DEAD = -1
+_HEADER = "╔══════════ Automata Simulator ══════════╗"
+
+
+class UnsupportedPatternError(ValueError):
+    """Raised when a pattern uses syntax the in-process engine does not mirror."""
+
+
+def _tokenize(pattern: str) -> list[str]:
+    """Split a pattern into tokens with explicit concatenation operators."""
+    tokens = []
+    for ch in pattern:
+        if ch not in _LITERAL_CHARS and ch != _ANY and ch not in "|()" and ch not in _POSTFIX_OPERATORS:
+            raise UnsupportedPatternError(f"Unsupported character {ch!r} in pattern.")
+        if tokens:
+            prev = tokens[-1]
+            prev_ends_operand = prev not in "|(" and prev != _CONCAT
+            starts_operand = ch not in "|)" and ch not in _POSTFIX_OPERATORS
+            if prev_ends_operand and starts_operand:
+                tokens.append(_CONCAT)
+        tokens.append(ch)
+    return tokens
+
+
+def _to_postfix(tokens: list[str]) -> list[str]:
+    """Convert infix tokens to postfix (shunting-yard, left-associative)."""
+    output = []
+    stack = []
+    for token in tokens:
+        if token == "(":
+            stack.append(token)
+        elif token == ")":
+            while stack and stack[-1] != "(":
+                output.append(stack.pop())
+            if not stack:
+                raise UnsupportedPatternError("Mismatched parentheses in regex pattern.")
+            stack.pop()
+        elif token in _PRECEDENCE:
+            while stack and stack[-1] != "(" and _PRECEDENCE[stack[-1]] >= _PRECEDENCE[token]:
+                output.append(stack.pop())
+            stack.append(token)
+        else:
+            output.append(token)
+    while stack:
+        token = stack.pop()
+        if token == "(":
+            raise UnsupportedPatternError("Mismatched parentheses in regex pattern.")
+        output.append(token)
+    return output
+
+
+class CompiledPattern:
+    """Thompson NFA for a pattern plus a lazily built, cached subset DFA."""
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        # Each state holds a list of (to, type, literal) edges in creation order,
+        # matching the layout of the binary's --dump-automaton output.
+        self.edges: list[list[tuple]] = []
+        self.start, self.accept = self._build(_to_postfix(_tokenize(pattern)))
+        self._closures: dict[int, frozenset] = {}
+        self._dfa_ids: dict[frozenset, int] = {}
+        self._dfa_sets: list[frozenset] = []
+        self._dfa_moves: dict[tuple[int, str], int] = {}
+        self.dfa_start = self._dfa_state(self._closure([self.start]))
+
+    def _new_state(self) -> int:
+        self.edges.append([])
+        return len(self.edges) - 1
+
+    def _epsilon(self, source: int, target: int) -> None:
+        self.edges[source].append((target, "epsilon", None))
+
+    def _build(self, postfix: list[str]) -> tuple[int, int]:
+        stack = []
+        for token in postfix:
+            if token in _LITERAL_CHARS or token == _ANY:
+                start, end = self._new_state(), self._new_state()
+                if token == _ANY:
+                    self.edges[start].append((end, "any", None))
+                else:
+                    self.edges[start].append((end, "literal", token))
+                stack.append((start, end))
+            elif token == _CONCAT:
+                if len(stack) < 2:
+                    raise UnsupportedPatternError("Invalid regex: concatenation missing operand.")
+                right = stack.pop()
+                left = stack.pop()
+                self._epsilon(left[1], right[0])
+                stack.append((left[0], right[1]))
+            elif token == "|":
+                if len(stack) < 2:
+                    raise UnsupportedPatternError("Invalid regex: union missing operand.")
+                right = stack.pop()
+                left = stack.pop()
+                start, end = self._new_state(), self._new_state()
+                self._epsilon(start, left[0])
+                self._epsilon(start, right[0])
+                self._epsilon(left[1], end)
+                self._epsilon(right[1], end)
+                stack.append((start, end))
+            else:
+                if not stack:
+                    raise UnsupportedPatternError("Invalid regex: repetition missing operand.")
+                inner = stack.pop()
+                start, end = self._new_state(), self._new_state()
+                self._epsilon(start, inner[0])
+                if token != "+":
+                    self._epsilon(start, end)
+                if token != "?":
+                    self._epsilon(inner[1], inner[0])
+                self._epsilon(inner[1], end)
+                stack.append((start, end))
+        if len(stack) != 1:
+            raise UnsupportedPatternError("Invalid regex pattern.")
+        return stack[0]
+
+    def _closure(self, states) -> frozenset:
+        seen = set()
+        pending = list(states)
+        while pending:
+            state = pending.pop()
+            if state in seen:
+                continue
+            seen.add(state)
+            pending.extend(to for to, kind, _ in self.edges[state] if kind == "epsilon")
+        return frozenset(seen)
+
+    def _dfa_state(self, nfa_states: frozenset) -> int:
+        if not nfa_states:
+            return _DEAD
+        dfa_id = self._dfa_ids.get(nfa_states)
+        if dfa_id is None:
+            if len(self._dfa_sets) >= IN_PROCESS_MAX_DFA_STATES:
+                raise UnsupportedPatternError(f"Pattern needs more than {IN_PROCESS_MAX_DFA_STATES} DFA states.")
+            dfa_id = len(self._dfa_sets)
+            self._dfa_ids[nfa_states] = dfa_id
+            self._dfa_sets.append(nfa_states)
+        return dfa_id
+
+    def _move(self, dfa_id: int, symbol: str) -> int:
+        """Return the DFA state reached on symbol, building it on first use."""
+        key = (dfa_id, symbol)
+        target = self._dfa_moves.get(key)
+        if target is None:
+            reached = [
+                to
+                for state in self._dfa_sets[dfa_id]
+                for to, kind, literal in self.edges[state]
+                if kind == "any" or (kind == "literal" and literal == symbol)
+            ]
+            target = self._dfa_state(self._closure(reached))
+            self._dfa_moves[key] = target
+        return target
+
+    def scan(self, sequence: str, mode: str) -> tuple[list[tuple[int, int]], int]:
+        """Return all non-empty [start,end) matches and the states visited count.
+
+        Every start position is simulated independently until the automaton dies
+        or the sequence ends. NFA mode counts the size of each active state set;
+        DFA mode counts one state per transition, including the dead state.
+        """
+        count_sets = mode == "nfa"
+        ranges = []
+        visited = 0
+        length = len(sequence)
+        for begin in range(length):
+            state = self.dfa_start
+            for pos in range(begin, length):
+                state = self._move(state, sequence[pos])
+                if state == _DEAD:
+                    if not count_sets:
+                        visited += 1
+                    break
+                nfa_states = self._dfa_sets[state]
+                visited += len(nfa_states) if count_sets else 1
+                if self.accept in nfa_states:
+                    ranges.append((begin, pos + 1))
+        return ranges, visited
+
+    def dump(self, mode: str) -> dict:
+        """Return the automaton in the binary's --dump-automaton JSON shape."""
+        if mode == "nfa":
+            return {
+                "kind": "NFA",
+                "start": self.start,
+                "accept": self.accept,
+                "states": [
+                    {
+                        "id": state,
+                        "accept": state == self.accept,
+                        "edges": [
+                            {"to": to, "type": kind, "literal": literal} if literal else {"to": to, "type": kind}
+                            for to, kind, literal in edges
+                        ],
+                    }
+                    for state, edges in enumerate(self.edges)
+                ],
+            }
+
+        # The binary numbers DFA states breadth-first over byte codes 0..255.
+        order = [self.dfa_start]
+        numbering = {self.dfa_start: 0}
+        states = []
+        for dfa_id in order:
+            transitions = []
+            for code in range(256):
+                target = self._move(dfa_id, chr(code))
+                if target == _DEAD:
+                    continue
+                if target not in numbering:
+                    numbering[target] = len(order)
+                    order.append(target)
+                transitions.append({"code": code, "symbol": chr(code), "to": numbering[target]})
+            states.append({
+                "id": numbering[dfa_id],
+                "accept": self.accept in self._dfa_sets[dfa_id],
+                "transitions": transitions,
+            })
+        return {"kind": "DFA", "start": 0, "states": states}
+
+
+@lru_cache(maxsize=256)
+def compile_pattern(pattern: str) -> CompiledPattern:
+    """Compile and cache a pattern; raises UnsupportedPatternError if it can't be mirrored."""
+    if not pattern:
+        raise UnsupportedPatternError("Empty pattern.")
+    return CompiledPattern(pattern)
+
+
+def render_stdout(compiled: CompiledPattern, mode: str, sequences: list[str]) -> str:
+    """Run the scan and format it exactly like automata_sim's stdout."""
+    lines = ["", _HEADER, f"Pattern: {compiled.pattern}", f"Datasets: {len(sequences)} sequence(s)",
+             f"Automaton Mode: {mode.upper()}", ""]
+    total_matches = 0
+    all_accepted = True
+    for number, sequence in enumerate(sequences, start=1):
+        ranges, visited = compiled.scan(sequence, mode)
+        total_matches += len(ranges)
+        all_accepted = all_accepted and (0, len(sequence)) in ranges
+        lines.append(f"Sequence #{number} (len={len(sequence)})")
+        if ranges:
+            lines.append("  Matches: " + "".join(f"[{start},{end}) " for start, end in ranges))
+            lines.append(f"  {sequence}")
+        else:
+            lines.append("  No matches found.")
+        lines.append(f"  States visited: {visited}")
+        lines.append("")
+    answer = "yes" if all_accepted and sequences else "no"
+    lines.append(f"Runs: {len(sequences)}, Matches: {total_matches}, All accepted: {answer}")
+    return "\n".join(lines) + "\n"
+
+
+def simulate_in_process(payload: dict, dump_automaton: bool = True) -> tuple[str, dict | None]:
+    """Simulate an inline-sequence NFA/DFA request without spawning the binary.
+
+    Returns the binary-compatible stdout and the automaton dump (None unless
+    `dump_automaton` is set). Raises UnsupportedPatternError when the request
+    must go through the binary, including when the DFA outgrows
+    IN_PROCESS_MAX_DFA_STATES.
+    """
+    mode = payload.get("mode", "auto").lower()
+    if mode not in IN_PROCESS_MODES:
+        raise UnsupportedPatternError(f"Mode '{mode}' is not handled in process.")
+    compiled = compile_pattern(payload.get("pattern", ""))
+    sequences = [seq.strip() for seq in payload.get("sequences") or [] if seq.strip()]
+    return render_stdout(compiled, mode, sequences), compiled.dump(mode) if dump_automaton else None
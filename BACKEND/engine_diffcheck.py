@@ -0,0 +1,99 @@
+"""Differential check of the in-process engine (engine.py) against automata_sim.
+
+    python BACKEND/engine_diffcheck.py [--cases 300] [--seed 1]
+
+Generates random patterns (literals, '.', '|', '*', '+', '?' and groups) and
+random DNA sequences (with the odd N), runs each case through
+simulate_in_process and through the binary with --dump-automaton, in both nfa
+and dfa mode, and compares the stdout and the dump byte for byte. Patterns the engine declines (for example
+past IN_PROCESS_MAX_DFA_STATES) are counted as skipped. Exits with status 1
+on any difference.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+from config import AUTOMATA_SIM_PATH, ensure_binary_available
+from engine import UnsupportedPatternError, simulate_in_process
+from utils import build_command
+
+ALPHABET = "ACGT"
+
+
+def random_pattern(rng: random.Random, depth: int = 0) -> str:
+    roll = rng.random()
+    if depth >= 3 or roll < 0.35:
+        return rng.choice(ALPHABET + ".") if rng.random() < 0.15 else "".join(rng.choices(ALPHABET, k=rng.randint(1, 3)))
+    if roll < 0.6:
+        return random_pattern(rng, depth + 1) + random_pattern(rng, depth + 1)
+    if roll < 0.75:
+        return f"({random_pattern(rng, depth + 1)}|{random_pattern(rng, depth + 1)})"
+    return f"({random_pattern(rng, depth + 1)}){rng.choice('*+?')}"
+
+
+def random_sequences(rng: random.Random) -> list[str]:
+    # An occasional N exercises '.' against bases no literal matches.
+    return [
+        "".join(rng.choices(ALPHABET + "N", weights=(6, 6, 6, 6, 1), k=rng.randint(1, 40)))
+        for _ in range(rng.randint(1, 4))
+    ]
+
+
+def run_binary(payload: dict) -> tuple[str, dict]:
+    with tempfile.TemporaryDirectory() as directory:
+        dataset_path = os.path.join(directory, "input.txt")
+        dump_path = os.path.join(directory, "automaton.json")
+        with open(dataset_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(payload["sequences"]) + "\n")
+        completed = subprocess.run(
+            build_command(payload, dataset_path, dump_path), capture_output=True, text=True, timeout=30
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.strip() or f"exit code {completed.returncode}")
+        with open(dump_path, encoding="utf-8") as f:
+            return completed.stdout, json.load(f)
+
+
+def check(payload: dict) -> str | None:
+    """Return a description of the first difference, or None if both agree."""
+    stdout, dump = simulate_in_process(payload)
+    expected_stdout, expected_dump = run_binary(payload)
+    if stdout != expected_stdout:
+        return f"stdout differs:\n--- binary\n{expected_stdout}--- in process\n{stdout}"
+    if dump != expected_dump:
+        return "automaton dump differs"
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=300, help="Random pattern/sequence cases per mode")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    ensure_binary_available()
+    rng = random.Random(args.seed)
+    checked = skipped = failed = 0
+    for _ in range(args.cases):
+        pattern, sequences = random_pattern(rng), random_sequences(rng)
+        for mode in ("nfa", "dfa"):
+            payload = {"pattern": pattern, "mode": mode, "sequences": sequences}
+            try:
+                difference = check(payload)
+            except UnsupportedPatternError:
+                skipped += 1
+                continue
+            checked += 1
+            if difference:
+                failed += 1
+                print(f"FAIL mode={mode} pattern={pattern!r} sequences={sequences!r}\n{difference}")
+    print(f"{checked} cases checked against {AUTOMATA_SIM_PATH}, {skipped} skipped, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
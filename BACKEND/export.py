@@ -0,0 +1,280 @@
+"""Columnar bulk export of match results.
+
+Matches are streamed straight from simulator output lines (or a stored
+/simulate JSON response) as NumPy start/end arrays, one sequence at a time,
+and written as:
+
+- bed: BED4 intervals (`seq<N>  start  end  pattern`, 0-based half-open)
+- tsv: one summary row per sequence
+- npy: one structured array with fields sequence_id, start, end
+- npz: separate sequence_id, start and end arrays
+
+No per-match dicts are built. Memory is bounded by the largest single
+sequence's match arrays, plus a spool file for npz end positions.
+
+Stored results can be converted from the command line:
+
+    python BACKEND/export.py result.json --format bed -o matches.bed
+    python BACKEND/export.py simulator_stdout.txt --format npz -o matches.npz
+"""
+import argparse
+import io
+import json
+import mmap
+import re
+import sys
+import tempfile
+import zipfile
+from collections.abc import Iterator, Sequence
+from typing import NamedTuple
+
+import numpy as np
+
+from aggregate import covered_length, parse_range_array
+from capture import MappedLines
+from utils import EXPORT_FORMATS
+
+TSV_COLUMNS = ("sequence_id", "length", "match_count", "covered_bases", "coverage", "states_visited")
+# Rows formatted per text chunk; bounds the size of each streamed piece.
+TEXT_CHUNK_ROWS = 65536
+INT32_MAX = np.iinfo(np.int32).max
+
+_SEQUENCE_HEADER = re.compile(r"Sequence #(\d+) \(len=(\d+)\)")
+_STATES_VISITED = re.compile(r"States visited: (\d+)")
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+class SequenceMatches(NamedTuple):
+    sequence_id: int
+    length: int
+    starts: np.ndarray
+    ends: np.ndarray
+    states_visited: int
+
+
+class LineSource:
+    """Matches read from simulator stdout lines (a list or capture.MappedLines)."""
+
+    def __init__(self, lines: Sequence[str]):
+        self.lines = lines
+        self.pattern = ""
+        for line in lines:
+            if line.startswith("Sequence #"):
+                break
+            if line.startswith("Pattern:"):
+                self.pattern = line.split("Pattern:", 1)[1].strip()
+
+    def _scan(self, parse: bool) -> Iterator[SequenceMatches]:
+        sequence_id = length = states = 0
+        starts = ends = _EMPTY
+        count = 0
+        open_sequence = False
+        for raw in self.lines:
+            line = raw.strip()
+            header = _SEQUENCE_HEADER.match(line)
+            if header:
+                if open_sequence:
+                    yield SequenceMatches(sequence_id, length, starts, ends, states) if parse else (sequence_id, length, count)
+                sequence_id, length = int(header.group(1)), int(header.group(2))
+                starts = ends = _EMPTY
+                count = states = 0
+                open_sequence = True
+            elif not open_sequence:
+                continue
+            elif line.startswith("Matches:"):
+                if parse:
+                    starts, ends = parse_range_array(line)
+                else:
+                    count = line.count("[")
+            elif line.startswith("States visited:"):
+                visited = _STATES_VISITED.match(line)
+                states = int(visited.group(1)) if visited else 0
+            elif line.startswith("Runs:"):
+                break
+        if open_sequence:
+            yield SequenceMatches(sequence_id, length, starts, ends, states) if parse else (sequence_id, length, count)
+
+    def records(self) -> Iterator[SequenceMatches]:
+        return self._scan(parse=True)
+
+    def counts(self) -> Iterator[tuple[int, int, int]]:
+        """(sequence_id, length, match count) per sequence, without parsing the ranges."""
+        return self._scan(parse=False)
+
+
+class ResultSource:
+    """Matches read from a parsed (stored) /simulate response."""
+
+    def __init__(self, result: dict):
+        self.result = result
+        self.pattern = result.get("pattern") or ""
+
+    def records(self) -> Iterator[SequenceMatches]:
+        for sequence in self.result.get("sequences", []):
+            ranges = sequence.get("match_ranges") or []
+            yield SequenceMatches(
+                sequence["sequence_number"],
+                sequence.get("length", 0),
+                np.fromiter((match["start"] for match in ranges), dtype=np.int64, count=len(ranges)),
+                np.fromiter((match["end"] for match in ranges), dtype=np.int64, count=len(ranges)),
+                sequence.get("states_visited", 0),
+            )
+
+    def counts(self) -> Iterator[tuple[int, int, int]]:
+        for sequence in self.result.get("sequences", []):
+            yield sequence["sequence_number"], sequence.get("length", 0), len(sequence.get("match_ranges") or [])
+
+
+def write_bed(source) -> Iterator[bytes]:
+    name = re.sub(r"\s+", "_", source.pattern) or "match"
+    for record in source.records():
+        prefix = f"seq{record.sequence_id}\t"
+        suffix = f"\t{name}\n"
+        for offset in range(0, record.starts.size, TEXT_CHUNK_ROWS):
+            rows = zip(
+                record.starts[offset:offset + TEXT_CHUNK_ROWS].tolist(),
+                record.ends[offset:offset + TEXT_CHUNK_ROWS].tolist(),
+            )
+            yield "".join(f"{prefix}{start}\t{end}{suffix}" for start, end in rows).encode()
+
+
+def write_tsv(source) -> Iterator[bytes]:
+    yield ("\t".join(TSV_COLUMNS) + "\n").encode()
+    rows = []
+    for record in source.records():
+        covered = covered_length(record.starts, record.ends)
+        coverage = covered / record.length if record.length else 0.0
+        rows.append(
+            f"{record.sequence_id}\t{record.length}\t{record.starts.size}\t{covered}\t{coverage:.6g}\t{record.states_visited}\n"
+        )
+        if len(rows) >= TEXT_CHUNK_ROWS:
+            yield "".join(rows).encode()
+            rows = []
+    if rows:
+        yield "".join(rows).encode()
+
+
+def _position_dtype(source) -> tuple[np.dtype, list[tuple[int, int]]]:
+    """Pick int32 positions unless a sequence is too long; also return (sequence_id, match count) pairs."""
+    counts = []
+    longest = 0
+    for sequence_id, length, count in source.counts():
+        counts.append((sequence_id, count))
+        longest = max(longest, length)
+    dtype = np.dtype("<i4") if longest <= INT32_MAX else np.dtype("<i8")
+    return dtype, counts
+
+
+def _npy_header(dtype, shape: tuple) -> bytes:
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        header, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": shape}
+    )
+    return header.getvalue()
+
+
+def write_npy(source) -> Iterator[bytes]:
+    position, counts = _position_dtype(source)
+    total = sum(count for _, count in counts)
+    dtype = np.dtype([("sequence_id", "<i4"), ("start", position), ("end", position)])
+    yield _npy_header(dtype, (total,))
+    for record in source.records():
+        rows = np.empty(record.starts.size, dtype=dtype)
+        rows["sequence_id"] = record.sequence_id
+        rows["start"] = record.starts
+        rows["end"] = record.ends
+        yield rows.tobytes()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable file object that collects what zipfile writes, for streaming."""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def write_npz(source) -> Iterator[bytes]:
+    """Stream an uncompressed .npz (np.load reads it) with three int columns.
+
+    sequence_id is rebuilt from the per-sequence counts; starts are streamed
+    as they are parsed and ends are spooled until the starts are done.
+    """
+    position, counts = _position_dtype(source)
+    total = sum(count for _, count in counts)
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        with archive.open("sequence_id.npy", "w", force_zip64=True) as member:
+            member.write(_npy_header(np.dtype("<i4"), (total,)))
+            for sequence_id, count in counts:
+                member.write(np.full(count, sequence_id, dtype="<i4").tobytes())
+                yield sink.drain()
+        with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as spooled_ends:
+            with archive.open("start.npy", "w", force_zip64=True) as member:
+                member.write(_npy_header(position, (total,)))
+                for record in source.records():
+                    member.write(record.starts.astype(position).tobytes())
+                    spooled_ends.write(record.ends.astype(position).tobytes())
+                    yield sink.drain()
+            spooled_ends.seek(0)
+            with archive.open("end.npy", "w", force_zip64=True) as member:
+                member.write(_npy_header(position, (total,)))
+                while chunk := spooled_ends.read(1 << 20):
+                    member.write(chunk)
+                    yield sink.drain()
+    yield sink.drain()
+
+
+WRITERS = {"bed": write_bed, "tsv": write_tsv, "npy": write_npy, "npz": write_npz}
+
+
+def export(source, fmt: str) -> Iterator[bytes]:
+    """Stream `source` (LineSource or ResultSource) in the given export format."""
+    return WRITERS[fmt](source)
+
+
+def load_stored(path: str):
+    """Open a stored result: a saved /simulate JSON response or raw simulator stdout.
+
+    Raw output is mapped rather than read, like spooled stdout in capture.py.
+    """
+    with open(path, "rb") as f:
+        if f.read(1024).lstrip()[:1] == b"{":
+            f.seek(0)
+            return ResultSource(json.load(f))
+        if not f.seek(0, 2):
+            return LineSource([""])
+        return LineSource(MappedLines(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export stored simulation results as BED, TSV, NPY or NPZ.")
+    parser.add_argument("input", help="saved /simulate JSON response or raw automata_sim stdout")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), required=True)
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    source = load_stored(args.input)
+    if args.output:
+        with open(args.output, "wb") as out:
+            for chunk in export(source, args.format):
+                out.write(chunk)
+    else:
+        for chunk in export(source, args.format):
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+
+
+if __name__ == "__main__":
+    main()
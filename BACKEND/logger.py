@@ -1,46 +1,89 @@
-"""Logging configuration for automata simulator API."""
+"""Logging configuration for automata simulator API.
+
+Records are handed to a queue on the request thread and formatted/written by
+a background QueueListener, so console and (rotating) file I/O never block a
+request. Records are JSON objects carrying the current request's trace ID.
+"""
+import atexit
+import contextvars
+import json
 import logging
 import os
+import queue
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Read once at startup; the request path only checks these module globals.
+DEBUG_ENABLED = os.environ.get("FLASK_DEBUG", "").lower() in ("true", "1", "yes")
+# Fraction of requests whose large payloads (command, stdout, stderr) are logged
+# in debug mode, and the most characters kept from any one payload.
+PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", "0.1"))
+PAYLOAD_MAX_CHARS = int(os.environ.get("LOG_PAYLOAD_MAX_CHARS", "2000"))
+
+_trace_id: contextvars.ContextVar[str | None] = contextvars.ContextVar("trace_id", default=None)
+_listeners: list[QueueListener] = []
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _TraceQueueHandler(QueueHandler):
+    """Queue handler that stamps the trace ID and defers all formatting to the listener."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.trace_id = _trace_id.get()
+        return record
 
 
 def setup_logger(name: str = "automata_simulator", log_level: str = "INFO") -> logging.Logger:
     """
     Set up and configure logger for the application.
-    
+
     Args:
         name: Logger name
         log_level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
-    
+
     Returns:
         Configured logger instance
     """
     logger = logging.getLogger(name)
-    
+
     # Don't add handlers if they already exist (avoid duplicates)
     if logger.handlers:
         return logger
-    
+
     # Set log level
     level = getattr(logging, log_level.upper(), logging.INFO)
     logger.setLevel(level)
-    
-    # Create console handler only (Vercel environment is read-only)
+    logger.propagate = False
+
+    formatter = JsonFormatter()
+
+    # Create console handler (Vercel environment is read-only)
     console_handler = logging.StreamHandler()
-    console_handler.setLevel(level)
-    
-    # Create formatter
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
-    
     console_handler.setFormatter(formatter)
-    
-    # Add handler to logger
-    logger.addHandler(console_handler)
-    
+    handlers = [console_handler]
+
     # Only add file handler if not in serverless environment
     # Check for writable filesystem (local development)
     try:
@@ -54,23 +97,30 @@ def setup_logger(name: str = "automata_simulator", log_level: str = "INFO") -> l
                 backupCount=5,
                 encoding="utf-8"
             )
-            file_handler.setLevel(level)
             file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
+            handlers.append(file_handler)
     except (OSError, PermissionError):
         # Silently skip file logging in read-only environments (like Vercel)
         pass
-    
+
+    # The request thread only enqueues; the listener thread formats, writes
+    # and rotates.
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    logger.addHandler(_TraceQueueHandler(log_queue))
+
     return logger
 
 
 def get_logger(name: str = "automata_simulator") -> logging.Logger:
     """
     Get logger instance, creating it if it doesn't exist.
-    
+
     Args:
         name: Logger name
-    
+
     Returns:
         Logger instance
     """
@@ -79,8 +129,67 @@ def get_logger(name: str = "automata_simulator") -> logging.Logger:
         # Determine log level from environment or default to INFO
         log_level = os.environ.get("LOG_LEVEL", "INFO")
         # Use DEBUG level if Flask debug mode is enabled
-        if os.environ.get("FLASK_DEBUG", "").lower() in ("true", "1", "yes"):
+        if DEBUG_ENABLED:
             log_level = "DEBUG"
         setup_logger(name, log_level)
     return logger
 
+
+def enable_debug(logger: logging.Logger) -> None:
+    """Switch debug logging on at startup (e.g. when running app.py directly)."""
+    global DEBUG_ENABLED
+    DEBUG_ENABLED = True
+    logger.setLevel(logging.DEBUG)
+
+
+@atexit.register
+def _stop_listeners() -> None:
+    # Flush queued records on interpreter exit.
+    for listener in _listeners:
+        listener.stop()
+    _listeners.clear()
+
+
+def truncate(text: str, limit: int = PAYLOAD_MAX_CHARS) -> str:
+    """Cap a payload for logging, noting how much was dropped."""
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more chars]"
+
+
+class RequestTrace:
+    """Trace ID and stage timings for one request."""
+
+    def __init__(self, trace_id: str | None = None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        # Decided once per request so all of a request's payloads are kept or dropped together.
+        self.sampled = DEBUG_ENABLED and random.random() < PAYLOAD_SAMPLE_RATE
+        _trace_id.set(self.trace_id)
+
+    def record(self, name: str, seconds: float) -> None:
+        """Add time spent in a stage; repeated stages accumulate."""
+        self.stages[name] = round(self.stages.get(name, 0.0) + seconds * 1000, 3)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def log_payload(self, logger: logging.Logger, message: str, **payloads) -> None:
+        """Debug-log large payloads (stdout, command, ...) for sampled requests only, capped in size."""
+        if self.sampled:
+            fields = {key: truncate(value) if isinstance(value, str) else value for key, value in payloads.items()}
+            logger.debug(message, extra={"fields": fields})
+
+    def finish(self, logger: logging.Logger, **fields) -> None:
+        """Log the request summary with stage timings and release the trace ID."""
+        fields["duration_ms"] = round((time.perf_counter() - self.started) * 1000, 3)
+        fields["stages_ms"] = self.stages
+        logger.info("request", extra={"fields": fields})
+        _trace_id.set(None)
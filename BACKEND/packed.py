@@ -0,0 +1,288 @@
+"""Compact in-memory storage of parsed results, and the result cache built on it.
+
+A parsed /simulate result is one dict per sequence holding the sequence text
+(one byte per base plus str overhead) and each match twice: the raw
+'[start,end)' strings in `matches` and one dict per range in `match_ranges`.
+PackedResult keeps the same information column-wise:
+
+- Sequence texts are packed 2 bits per base (A, C, G, T/U) into one shared
+  buffer, with per-sequence offsets and an exception list (positions plus
+  bytes) for everything else: N, IUPAC codes, lowercase, gaps. Each sequence
+  decodes code 3 as U or T, whichever it mostly uses.
+- Match ranges are int32 start/end arrays (int64 only past 2^31) in binary
+  order, with per-sequence offsets.
+- The remaining small per-sequence fields are a tuple of values against
+  one shared tuple of field names.
+
+to_dict() rebuilds the exact parsed shape. Expansion happens only when a
+cached result is served, one response at a time.
+
+NumPy is imported on first use, so cold starts that never pack or unpack a
+result don't load it.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from automaton_view import estimated_size
+from config import RESULT_CACHE_BYTES
+from parser import add_summary_statistics
+
+PACKED_TEXT_FIELDS = ("sequence_text", "rna_sequence")
+RANGE_FIELDS = ("matches", "match_ranges")
+_BASES_T = b"ACGT"
+_BASES_U = b"ACGU"
+
+
+def _np():
+    import numpy as np
+
+    return np
+
+
+class PackedTexts:
+    """Many short strings (or None) packed 2 bits per nucleotide into one buffer."""
+
+    __slots__ = ("data", "offsets", "uracil", "missing", "exception_positions", "exception_bytes")
+
+    def __init__(self, texts: list[str | None]):
+        np = _np()
+        encoded = [(text or "").encode("utf-8") for text in texts]
+        self.missing = np.fromiter((text is None for text in texts), dtype=bool, count=len(texts))
+        self.uracil = np.fromiter((raw.count(b"U") > raw.count(b"T") for raw in encoded), dtype=bool, count=len(texts))
+        lengths = np.fromiter((len(raw) for raw in encoded), dtype=np.int64, count=len(texts))
+        self.offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        raw = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        codes = np.full(256, 255, dtype=np.uint8)
+        codes[list(_BASES_T)] = np.arange(4, dtype=np.uint8)
+        codes[ord("U")] = 3
+        packed_codes = codes[raw]
+        uracil_bytes = np.repeat(self.uracil, lengths)
+        exceptions = (packed_codes == 255) | ((raw == ord("U")) & ~uracil_bytes) | ((raw == ord("T")) & uracil_bytes)
+        positions = np.flatnonzero(exceptions)
+        self.exception_positions = positions.astype(np.int32 if raw.size <= np.iinfo(np.int32).max else np.int64)
+        self.exception_bytes = raw[positions].tobytes()
+        packed_codes[exceptions] = 0
+
+        padded = np.zeros(-(-raw.size // 4) * 4, dtype=np.uint8)
+        padded[: raw.size] = packed_codes
+        quads = padded.reshape(-1, 4)
+        self.data = quads[:, 0] | (quads[:, 1] << 2) | (quads[:, 2] << 4) | (quads[:, 3] << 6)
+
+    def __len__(self) -> int:
+        return self.missing.size
+
+    def __getitem__(self, index: int) -> str | None:
+        if self.missing[index]:
+            return None
+        np = _np()
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        if start == end:
+            return ""
+        chunk = self.data[start // 4 : (end + 3) // 4]
+        codes = np.empty((chunk.size, 4), dtype=np.uint8)
+        for shift in range(4):
+            codes[:, shift] = (chunk >> (2 * shift)) & 3
+        codes = codes.reshape(-1)[start % 4 : start % 4 + end - start]
+        letters = np.frombuffer(_BASES_U if self.uracil[index] else _BASES_T, dtype=np.uint8)[codes]
+        first, last = np.searchsorted(self.exception_positions, (start, end))
+        if last > first:
+            letters[self.exception_positions[first:last] - start] = np.frombuffer(
+                self.exception_bytes, dtype=np.uint8, count=last - first, offset=first
+            )
+        return letters.tobytes().decode("utf-8")
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.data, self.offsets, self.uracil, self.missing, self.exception_positions)
+        return sum(array.nbytes for array in arrays) + len(self.exception_bytes)
+
+
+class PackedRanges:
+    """Per-sequence [start, end) match lists as shared int32 start/end arrays."""
+
+    __slots__ = ("starts", "ends", "offsets")
+
+    def __init__(self, range_lists: list[list[tuple[int, int]]]):
+        np = _np()
+        counts = np.fromiter((len(ranges) for ranges in range_lists), dtype=np.int64, count=len(range_lists))
+        self.offsets = np.zeros(len(range_lists) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        flat = np.array([bound for ranges in range_lists for pair in ranges for bound in pair], dtype=np.int64)
+        dtype = np.int32 if not flat.size or flat.max() <= np.iinfo(np.int32).max else np.int64
+        self.starts = flat[0::2].astype(dtype)
+        self.ends = flat[1::2].astype(dtype)
+
+    def __getitem__(self, index: int) -> tuple[list[str], list[dict]]:
+        """The sequence's `matches` strings (binary order) and `match_ranges` dicts (by start)."""
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        pairs = list(zip(self.starts[start:end].tolist(), self.ends[start:end].tolist()))
+        raw = [f"[{a},{b})" for a, b in pairs]
+        parsed = [{"range": text, "start": a, "end": b, "length": b - a} for text, (a, b) in zip(raw, pairs)]
+        parsed.sort(key=lambda match: match["start"])
+        return raw, parsed
+
+    @property
+    def nbytes(self) -> int:
+        return self.starts.nbytes + self.ends.nbytes + self.offsets.nbytes
+
+
+def _canonical_ranges(sequence: dict) -> list[tuple[int, int]] | None:
+    """The sequence's ranges as (start, end) pairs, if they round-trip exactly."""
+    pairs = [(match["start"], match["end"]) for match in sequence["match_ranges"]]
+    raw = sequence["matches"]
+    if len(raw) != len(pairs):
+        return None
+    by_text = {f"[{a},{b})": (a, b) for a, b in pairs}
+    try:
+        ordered = [by_text[text] for text in raw]
+    except KeyError:
+        return None
+    return ordered
+
+
+class PackedResult:
+    """A parsed /simulate result stored column-wise (see the module docstring)."""
+
+    __slots__ = ("header", "field_names", "fields", "texts", "rna_texts", "ranges", "nbytes", "pda_view")
+
+    def __init__(self, result: dict):
+        sequences = result["sequences"]
+        # metrics describe the run that produced the result, not later hits.
+        self.header = {key: value for key, value in result.items() if key not in ("sequences", "pda_sequences", "metrics")}
+        self.pda_view = "pda_sequences" in result
+        ranges = [_canonical_ranges(sequence) for sequence in sequences]
+        self.field_names = tuple(key for key in sequences[0] if key not in PACKED_TEXT_FIELDS) if sequences else ()
+        self.fields = []
+        for sequence, pairs in zip(sequences, ranges):
+            skip = PACKED_TEXT_FIELDS + (RANGE_FIELDS if pairs is not None else ())
+            names = tuple(key for key in sequence if key not in skip)
+            if pairs is not None and names == tuple(key for key in self.field_names if key not in RANGE_FIELDS):
+                self.fields.append(tuple(sequence[key] for key in names))
+            else:
+                # Unusual entry: keep what isn't packed as a plain dict.
+                self.fields.append({key: sequence[key] for key in names})
+        self.field_names = tuple(key for key in self.field_names if key not in RANGE_FIELDS)
+        self.texts = PackedTexts([sequence.get("sequence_text") for sequence in sequences])
+        self.rna_texts = PackedTexts([sequence.get("rna_sequence") for sequence in sequences])
+        self.ranges = PackedRanges([pairs or [] for pairs in ranges])
+        self.nbytes = (
+            self.texts.nbytes
+            + self.rna_texts.nbytes
+            + self.ranges.nbytes
+            + estimated_size(self.fields)
+            + estimated_size(self.header)
+        )
+
+    def sequence(self, index: int) -> dict:
+        fields = self.fields[index]
+        if isinstance(fields, dict):
+            sequence = dict(fields)
+        else:
+            sequence = dict(zip(self.field_names, fields))
+            sequence["matches"], sequence["match_ranges"] = self.ranges[index]
+        sequence["sequence_text"] = self.texts[index]
+        sequence["rna_sequence"] = self.rna_texts[index]
+        return sequence
+
+    def to_dict(self) -> dict:
+        result = dict(self.header)
+        result["sequences"] = [self.sequence(index) for index in range(len(self.fields))]
+        if self.pda_view:
+            # Rebuilt rather than stored, as it repeats the sequence texts.
+            add_summary_statistics(result)
+            result.update(self.header)
+        return result
+
+
+class ResultCache:
+    """Thread-safe LRU of PackedResults, bounded by their estimated size in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = 0
+
+    def get(self, key) -> PackedResult | None:
+        if key is None:
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, result: dict) -> None:
+        """Pack and store a parsed result (too large ones are skipped)."""
+        if key is None or self.max_bytes <= 0:
+            return
+        packed = PackedResult(result)
+        if packed.nbytes > self.max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key).nbytes
+            self._entries[key] = packed
+            self.bytes += packed.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
+def _file_identity(path: str | None):
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path, None
+    return os.path.realpath(path), stat.st_size, stat.st_mtime_ns
+
+
+def _digest(lines: list[str]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for line in lines:
+        digest.update(line.encode("utf-8", errors="surrogatepass"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def result_cache_key(payload: dict, aggregation: dict | None, automaton_options: dict) -> tuple | None:
+    """Cache key for a binary run: what it ran on and how the response was shaped.
+
+    Datasets on disk are identified by path, size and mtime, and inline
+    sequences by a digest, so changed input is never served from the cache.
+    """
+    if payload.get("input_path"):
+        dataset = _file_identity(payload["input_path"])
+        if dataset[-1] is None:
+            return None
+    else:
+        dataset = _digest(payload.get("sequences") or [])
+    return (
+        (payload.get("mode") or "auto").lower(),
+        payload.get("pattern", ""),
+        payload.get("mismatch_budget"),
+        bool(payload.get("allow_dot_bracket")),
+        bool(payload.get("rna_mode")),
+        _file_identity(payload.get("secondary_structure_path")),
+        _digest(payload.get("secondary_structures") or []),
+        dataset,
+        tuple(sorted(aggregation.items())) if aggregation else None,
+        automaton_options["view"],
+        automaton_options["max_states"],
+    )
+
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_BYTES)
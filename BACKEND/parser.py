@@ -1,5 +1,6 @@
 """Parser module for automata simulator stdout output."""
 import re
+from collections.abc import Sequence
 
 
 def parse_match_range(match_str: str) -> dict:
@@ -17,10 +18,137 @@ def parse_match_range(match_str: str) -> dict:
         }
     return {"range": match_str, "start": 0, "end": 0, "length": 0}
 
-#comment for testing
-def parse_stdout(stdout: str) -> dict:
-    """Parse the stdout from automata_sim into structured JSON."""
-    result = {
+def new_sequence_data(seq_num: int, seq_len: int) -> dict:
+    """Return an empty per-sequence entry in the shape the frontend expects."""
+    return {
+        "sequence_number": seq_num,
+        "length": seq_len,
+        "matches": [],
+        "match_ranges": [],
+        "sequence_text": "",
+        "states_visited": 0,
+        "max_stack_depth": None,  # Only for PDA mode
+        # RNA/PDA-specific fields
+        "rna_sequence": None,
+        "dot_bracket": None,
+        "rna_valid_bases": None,
+        "rna_checks": [],
+        "rna_result": None,
+        "pda_messages": [],
+        "is_rna_mode": False,
+    }
+
+
+def set_match_ranges(sequence_data: dict, match_ranges_raw: list[str]) -> None:
+    """Store raw '[start,end)' strings and their parsed form on a sequence entry."""
+    sequence_data["matches"] = match_ranges_raw
+    # Parse into structured format
+    match_ranges_parsed = [
+        parse_match_range(m) for m in match_ranges_raw
+    ]
+    # Sort by start position for easier visualization
+    match_ranges_parsed.sort(key=lambda x: x["start"])
+    sequence_data["match_ranges"] = match_ranges_parsed
+
+
+def set_match_arrays(sequence_data: dict, starts, ends, aggregation: dict) -> None:
+    """Store matches given as start/end arrays, summarized per the aggregation options."""
+    from aggregate import summarize_matches
+
+    keep, fields = summarize_matches(starts, ends, sequence_data["length"], aggregation)
+    if keep:
+        set_match_ranges(
+            sequence_data,
+            [f"[{start},{end})" for start, end in zip(starts[:keep].tolist(), ends[:keep].tolist())],
+        )
+    sequence_data.update(fields)
+
+
+def finalize_sequence_data(sequence_data: dict) -> None:
+    """Derive match counts, coverage and PDA validation for a sequence entry."""
+    seq_len = sequence_data["length"]
+    is_rna_mode = sequence_data["is_rna_mode"]
+
+    # Normalize sequence text when running RNA validation so UI consumers
+    # don't need to read two different fields.
+    if is_rna_mode and sequence_data["rna_sequence"]:
+        sequence_data["sequence_text"] = sequence_data["rna_sequence"]
+
+    if is_rna_mode:
+        # Treat a valid RNA pairing as a successful match for stats/coverage.
+        sequence_data["match_count"] = 1 if sequence_data["rna_result"] == "Valid" else 0
+        sequence_data["has_matches"] = sequence_data["match_count"] > 0
+        if sequence_data["has_matches"] and seq_len > 0:
+            sequence_data["coverage"] = 1.0
+        else:
+            sequence_data["coverage"] = 0.0
+
+        sequence_data["pda_validation"] = {
+            "sequence": sequence_data.get("rna_sequence"),
+            "structure": sequence_data.get("dot_bracket"),
+            "valid_rna_bases": sequence_data.get("rna_valid_bases"),
+            "checks": sequence_data.get("rna_checks", []),
+            "result": sequence_data.get("rna_result"),
+            "messages": sequence_data.get("pda_messages", []),
+        }
+    elif "match_count" not in sequence_data:
+        # Entries filled by set_match_arrays already carry counts and coverage.
+        # Add match count for regex/NFA/DFA/EFA/PDA (dot-bracket) modes
+        sequence_data["match_count"] = len(sequence_data["matches"])
+        sequence_data["has_matches"] = len(sequence_data["matches"]) > 0
+
+        # Calculate match coverage (percentage of sequence covered by matches)
+        if sequence_data["match_ranges"] and seq_len > 0:
+            covered_positions = set()
+            for match_range in sequence_data["match_ranges"]:
+                covered_positions.update(range(match_range["start"], match_range["end"]))
+            sequence_data["coverage"] = len(covered_positions) / seq_len
+        else:
+            sequence_data["coverage"] = 0.0
+
+
+def add_summary_statistics(result: dict) -> dict:
+    """Add visualization summaries (and PDA views) to a parsed result."""
+    result["total_sequences"] = len(result["sequences"])
+    result["sequences_with_matches"] = sum(
+        1 for seq in result["sequences"] if seq.get("has_matches", False)
+    )
+    result["total_states_visited"] = sum(
+        seq.get("states_visited", 0) for seq in result["sequences"]
+    )
+    result["average_coverage"] = (
+        sum(seq.get("coverage", 0.0) for seq in result["sequences"])
+        / result["total_sequences"]
+        if result["total_sequences"] > 0
+        else 0.0
+    )
+
+    if result["automaton_mode"].lower() == "pda":
+        pda_sequences = []
+        for seq in result["sequences"]:
+            pda_sequences.append(
+                {
+                    "sequence_number": seq.get("sequence_number"),
+                    "length": seq.get("length"),
+                    "sequence": seq.get("sequence_text"),
+                    "dot_bracket": seq.get("dot_bracket"),
+                    "result": seq.get("rna_result"),
+                    "valid_rna_bases": seq.get("rna_valid_bases"),
+                    "checks": seq.get("rna_checks", []),
+                    "messages": seq.get("pda_messages", []),
+                    "has_matches": seq.get("has_matches", False),
+                    "match_count": seq.get("match_count", 0),
+                    "coverage": seq.get("coverage", 0.0),
+                }
+            )
+        result["pda_sequences"] = pda_sequences
+
+    return result
+
+
+def new_result() -> dict:
+    """Return an empty top-level result in the shape parse_stdout produces."""
+    return {
         "pattern": "",
         "datasets": "",
         "dataset_count": 0,
@@ -31,10 +159,33 @@ def parse_stdout(stdout: str) -> dict:
         "all_accepted": False,
     }
 
-    lines = stdout.strip().split("\n")
+
+def parse_stdout(stdout: str, aggregation: dict | None = None) -> dict:
+    """Parse the stdout from automata_sim into structured JSON.
+
+    With aggregation options (see utils.parse_aggregation_options), match
+    lines are parsed straight into arrays and summarized instead of expanded
+    into one dict per range.
+    """
+    return parse_lines(stdout.strip().split("\n"), aggregation)
+
+
+def parse_lines(lines: Sequence[str], aggregation: dict | None = None) -> dict:
+    """Parse automata_sim stdout given as a sequence of stripped-output lines.
+
+    `lines` may be lazy (see capture.MappedLines): it is indexed line by line
+    and never joined back into one string.
+    """
+    if aggregation is not None:
+        # NumPy is only loaded for aggregated responses (cold starts).
+        from aggregate import parse_range_array
+
+    result = new_result()
 
     # Parse header information
     for line in lines:
+        if line.startswith("Sequence #"):
+            break
         if line.startswith("Pattern:"):
             result["pattern"] = line.split("Pattern:", 1)[1].strip()
         elif line.startswith("Datasets:"):
@@ -61,23 +212,7 @@ def parse_stdout(stdout: str) -> dict:
             seq_num = int(seq_match.group(1))
             seq_len = int(seq_match.group(2))
 
-            sequence_data = {
-                "sequence_number": seq_num,
-                "length": seq_len,
-                "matches": [],
-                "match_ranges": [],
-                "sequence_text": "",
-                "states_visited": 0,
-                "max_stack_depth": None,  # Only for PDA mode
-                # RNA/PDA-specific fields
-                "rna_sequence": None,
-                "dot_bracket": None,
-                "rna_valid_bases": None,
-                "rna_checks": [],
-                "rna_result": None,
-                "pda_messages": [],
-                "is_rna_mode": False,
-            }
+            sequence_data = new_sequence_data(seq_num, seq_len)
 
             # Look ahead for RNA-specific format
             # RNA format: Sequence: CGUAGCUCUG
@@ -161,18 +296,15 @@ def parse_stdout(stdout: str) -> dict:
                     matches_line = lines[i]
                     matches_match = matches_pattern.match(matches_line)
                     if matches_match:
-                        matches_str = matches_match.group(1).strip()
-                        # Extract all match ranges like [0,1) [0,3) etc.
-                        # Use a more precise pattern to ensure we get individual ranges
-                        match_ranges_raw = re.findall(r"\[\d+,\d+\)", matches_str)
-                        sequence_data["matches"] = match_ranges_raw
-                        # Parse into structured format
-                        match_ranges_parsed = [
-                            parse_match_range(m) for m in match_ranges_raw
-                        ]
-                        # Sort by start position for easier visualization
-                        match_ranges_parsed.sort(key=lambda x: x["start"])
-                        sequence_data["match_ranges"] = match_ranges_parsed
+                        if aggregation is not None:
+                            starts, ends = parse_range_array(matches_line)
+                            set_match_arrays(sequence_data, starts, ends, aggregation)
+                        else:
+                            matches_str = matches_match.group(1).strip()
+                            # Extract all match ranges like [0,1) [0,3) etc.
+                            # Use a more precise pattern to ensure we get individual ranges
+                            match_ranges_raw = re.findall(r"\[\d+,\d+\)", matches_str)
+                            set_match_ranges(sequence_data, match_ranges_raw)
 
                 # Get sequence text from next line (may be indented, no label)
                 i += 1
@@ -184,7 +316,10 @@ def parse_stdout(stdout: str) -> dict:
 
                 # Get states visited (may be indented)
                 # For PDA mode, this may also include "Max stack depth"
-                i += 1
+                # "No matches found." sequences have no text line, so the states
+                # line may already be the current one.
+                if i < len(lines) and not states_visited_pattern.match(lines[i]):
+                    i += 1
                 if i < len(lines):
                     states_line = lines[i]
                     states_match = states_visited_pattern.match(states_line)
@@ -194,42 +329,11 @@ def parse_stdout(stdout: str) -> dict:
                         if states_match.group(2):
                             sequence_data["max_stack_depth"] = int(states_match.group(2))
 
-            # Normalize sequence text when running RNA validation so UI consumers
-            # don't need to read two different fields.
-            if is_rna_mode and sequence_data["rna_sequence"]:
-                sequence_data["sequence_text"] = sequence_data["rna_sequence"]
-
-            if is_rna_mode:
-                # Treat a valid RNA pairing as a successful match for stats/coverage.
-                sequence_data["match_count"] = 1 if sequence_data["rna_result"] == "Valid" else 0
-                sequence_data["has_matches"] = sequence_data["match_count"] > 0
-                if sequence_data["has_matches"] and seq_len > 0:
-                    sequence_data["coverage"] = 1.0
-                else:
-                    sequence_data["coverage"] = 0.0
-
-                sequence_data["pda_validation"] = {
-                    "sequence": sequence_data.get("rna_sequence"),
-                    "structure": sequence_data.get("dot_bracket"),
-                    "valid_rna_bases": sequence_data.get("rna_valid_bases"),
-                    "checks": sequence_data.get("rna_checks", []),
-                    "result": sequence_data.get("rna_result"),
-                    "messages": sequence_data.get("pda_messages", []),
-                }
-            else:
-                # Add match count for regex/NFA/DFA/EFA/PDA (dot-bracket) modes
-                sequence_data["match_count"] = len(sequence_data["matches"])
-                sequence_data["has_matches"] = len(sequence_data["matches"]) > 0
-                
-                # Calculate match coverage (percentage of sequence covered by matches)
-                if sequence_data["match_ranges"] and seq_len > 0:
-                    covered_positions = set()
-                    for match_range in sequence_data["match_ranges"]:
-                        covered_positions.update(range(match_range["start"], match_range["end"]))
-                    sequence_data["coverage"] = len(covered_positions) / seq_len
-                else:
-                    sequence_data["coverage"] = 0.0
+                if aggregation is not None and "match_count" not in sequence_data:
+                    empty = parse_range_array("")
+                    set_match_arrays(sequence_data, empty[0], empty[1], aggregation)
 
+            finalize_sequence_data(sequence_data)
             result["sequences"].append(sequence_data)
         i += 1
 
@@ -237,7 +341,8 @@ def parse_stdout(stdout: str) -> dict:
     summary_pattern = re.compile(
         r"Runs: (\d+), Matches: (\d+), All accepted: (yes|no)"
     )
-    for line in lines:
+    # The summary is the last line; search backwards so sequence text can't shadow it.
+    for line in reversed(lines):
         summary_match = summary_pattern.search(line)
         if summary_match:
             result["runs"] = int(summary_match.group(1))
@@ -246,38 +351,4 @@ def parse_stdout(stdout: str) -> dict:
             break
 
     # Add summary statistics for visualization
-    result["total_sequences"] = len(result["sequences"])
-    result["sequences_with_matches"] = sum(
-        1 for seq in result["sequences"] if seq.get("has_matches", False)
-    )
-    result["total_states_visited"] = sum(
-        seq.get("states_visited", 0) for seq in result["sequences"]
-    )
-    result["average_coverage"] = (
-        sum(seq.get("coverage", 0.0) for seq in result["sequences"])
-        / result["total_sequences"]
-        if result["total_sequences"] > 0
-        else 0.0
-    )
-
-    if result["automaton_mode"].lower() == "pda":
-        pda_sequences = []
-        for seq in result["sequences"]:
-            pda_sequences.append(
-                {
-                    "sequence_number": seq.get("sequence_number"),
-                    "length": seq.get("length"),
-                    "sequence": seq.get("sequence_text"),
-                    "dot_bracket": seq.get("dot_bracket"),
-                    "result": seq.get("rna_result"),
-                    "valid_rna_bases": seq.get("rna_valid_bases"),
-                    "checks": seq.get("rna_checks", []),
-                    "messages": seq.get("pda_messages", []),
-                    "has_matches": seq.get("has_matches", False),
-                    "match_count": seq.get("match_count", 0),
-                    "coverage": seq.get("coverage", 0.0),
-                }
-            )
-        result["pda_sequences"] = pda_sequences
-
-    return result
+    return add_summary_statistics(result)
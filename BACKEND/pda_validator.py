@@ -0,0 +1,197 @@
+"""Vectorized RNA secondary-structure validator for PDA mode.
+
+Mirrors the binary's RNA checks (length, bases, bracket balance, base pairing)
+with NumPy over the whole batch: balance comes from a cumulative depth sum,
+partners from a stack-free pairing table, and pair validity from lookup arrays.
+Results are built as parse_stdout-shaped entries with `pda_validation` objects,
+without rendering or re-parsing stdout text.
+"""
+import numpy as np
+
+from parser import add_summary_statistics, finalize_sequence_data, new_result, new_sequence_data
+
+RNA_BASES = "AUCG"
+# The binary accepts Watson-Crick pairs only; G-U wobble pairs are reported invalid.
+VALID_PAIRS = ("AU", "UA", "GC", "CG")
+
+_OPEN = ord("(")
+_CLOSE = ord(")")
+
+_VALID_BASE = np.zeros(256, dtype=bool)
+_UPPER = np.arange(256, dtype=np.uint8)
+for _base in RNA_BASES:
+    _VALID_BASE[ord(_base)] = _VALID_BASE[ord(_base.lower())] = True
+    _UPPER[ord(_base.lower())] = ord(_base)
+_PAIR_OK = np.zeros((256, 256), dtype=bool)
+for _left, _right in VALID_PAIRS:
+    _PAIR_OK[ord(_left), ord(_right)] = True
+
+
+class UnsupportedValidationError(ValueError):
+    """Raised when a request can't be served by the vectorized validator."""
+
+
+def pairing_table(structure: str) -> tuple[bool, np.ndarray, np.ndarray, int]:
+    """Return (balanced, open positions, close positions, max depth) for a dot-bracket string.
+
+    Pairs are found without a stack: in a balanced string the k-th '(' that
+    opens depth d pairs with the k-th ')' that closes depth d. Pairs are
+    ordered by closing position, which is the order the binary reports them.
+    Characters other than '(' and ')' are unpaired.
+    """
+    codes = np.frombuffer(structure.encode("ascii"), dtype=np.uint8)
+    step = (codes == _OPEN).astype(np.int64) - (codes == _CLOSE).astype(np.int64)
+    depth = np.cumsum(step)
+    empty = np.empty(0, dtype=np.int64)
+    if not depth.size:
+        return True, empty, empty, 0
+    if depth.min() < 0:
+        # Like the binary, an unmatched ')' rejects the structure before any depth is recorded.
+        return False, empty, empty, 0
+    max_depth = int(depth.max())
+    if depth[-1] != 0:
+        return False, empty, empty, max_depth
+
+    open_pos = np.flatnonzero(step == 1)
+    close_pos = np.flatnonzero(step == -1)
+    open_order = np.lexsort((open_pos, depth[open_pos]))
+    close_order = np.lexsort((close_pos, depth[close_pos] + 1))
+    opens = open_pos[open_order]
+    closes = close_pos[close_order]
+    by_close = np.argsort(closes, kind="stable")
+    return True, opens[by_close], closes[by_close], max_depth
+
+
+def validate_batch(sequences: list[str], structure: str) -> list[dict]:
+    """Validate every sequence against one dot-bracket structure.
+
+    Returns one dict per sequence with valid_rna_bases, checks, result and
+    messages, in the same shape parse_stdout reads from the binary's output.
+    """
+    balanced, opens, closes, _ = pairing_table(structure)
+    width = len(structure)
+    outcomes = [None] * len(sequences)
+
+    same_length = [index for index, seq in enumerate(sequences) if len(seq) == width]
+    for index, seq in enumerate(sequences):
+        if len(seq) != width:
+            outcomes[index] = {
+                "valid_rna_bases": None,
+                "checks": [],
+                "result": "Invalid",
+                "messages": [
+                    "[FAIL] Length Mismatch!",
+                    f"Sequence length: {len(seq)}",
+                    f"Structure length: {width}",
+                ],
+            }
+    if not same_length:
+        return outcomes
+
+    matrix = np.frombuffer("".join(sequences[index] for index in same_length).encode("ascii"), dtype=np.uint8)
+    matrix = matrix.reshape(len(same_length), width)
+    invalid = ~_VALID_BASE[matrix]
+    has_invalid = invalid.any(axis=1)
+
+    upper = _UPPER[matrix]
+    left = upper[:, opens]
+    right = upper[:, closes]
+    pair_ok = _PAIR_OK[left, right]
+    all_pairs_ok = pair_ok.all(axis=1)
+
+    open_numbers = (opens + 1).tolist()
+    close_numbers = (closes + 1).tolist()
+    balance_check = f"Parentheses balanced? {'[OK]' if balanced else '[FAIL]'}"
+
+    for row, index in enumerate(same_length):
+        if has_invalid[row]:
+            found = matrix[row][invalid[row]].tobytes().decode("ascii")
+            outcomes[index] = {
+                "valid_rna_bases": None,
+                "checks": [],
+                "result": "Invalid",
+                "messages": [
+                    "[FAIL] Invalid RNA Sequence!",
+                    f"RNA can only contain: {', '.join(RNA_BASES)}",
+                    f"Invalid characters found: {found}",
+                ],
+            }
+            continue
+        checks = [
+            f"{open_number}th nucleotide {chr(left_base)} <-> {close_number}th nucleotide {chr(right_base)} -> "
+            + ("valid? [OK]" if ok else "invalid? [FAIL]")
+            for open_number, close_number, left_base, right_base, ok in zip(
+                open_numbers, close_numbers, left[row].tolist(), right[row].tolist(), pair_ok[row].tolist()
+            )
+        ]
+        checks.append(balance_check)
+        outcomes[index] = {
+            "valid_rna_bases": True,
+            "checks": checks,
+            "result": "Valid" if balanced and all_pairs_ok[row] else "Invalid",
+            "messages": [],
+        }
+    return outcomes
+
+
+def pda_automaton_dump(structure: str) -> dict:
+    """Return the PDA in the binary's --dump-automaton JSON shape for a structure."""
+    _, _, _, max_depth = pairing_table(structure)
+    states = []
+    for depth in range(max_depth + 1):
+        transitions = []
+        if depth < max_depth:
+            transitions.append({"code": _OPEN, "symbol": "(", "to": depth + 1, "operation": "push"})
+        if depth > 0:
+            transitions.append({"code": _CLOSE, "symbol": ")", "to": depth - 1, "operation": "pop"})
+        transitions.append({"code": ord("."), "symbol": ".", "to": depth, "operation": "ignore"})
+        states.append({"id": depth, "accept": depth == 0, "stackDepth": depth, "transitions": transitions})
+    return {"kind": "PDA", "start": 0, "states": states, "rules": [{"expected": "("}, {"expected": ")"}]}
+
+
+def simulate_rna_batch(payload: dict, dump_automaton: bool = True) -> dict:
+    """Validate inline RNA sequences against inline structures without the binary.
+
+    Like the binary, only the first secondary structure is used for every
+    sequence, and the PDA is dumped (in PDA mode) only if `dump_automaton` is
+    set. Raises UnsupportedValidationError when the request must go through
+    the binary.
+    """
+    mode = payload.get("mode", "auto").lower()
+    if mode not in {"auto", "pda"} or not payload.get("rna_mode"):
+        raise UnsupportedValidationError("Vectorized validator only handles RNA PDA requests.")
+    structures = payload.get("secondary_structures") or []
+    structure = structures[0].strip() if structures else ""
+    sequences = [seq.strip() for seq in payload.get("sequences") or [] if seq.strip()]
+    if not structure or not sequences:
+        raise UnsupportedValidationError("Vectorized validator needs inline sequences and structures.")
+    if not all(text.isascii() and not any(ch.isspace() for ch in text) for text in [structure, *sequences]):
+        raise UnsupportedValidationError("Vectorized validator needs ASCII input without inner whitespace.")
+
+    outcomes = validate_batch(sequences, structure)
+
+    result = new_result()
+    result["pattern"] = payload.get("pattern", "")
+    result["datasets"] = f"{len(sequences)} sequence(s)"
+    result["dataset_count"] = len(sequences)
+    result["automaton_mode"] = "PDA"
+    for number, (sequence, outcome) in enumerate(zip(sequences, outcomes), start=1):
+        sequence_data = new_sequence_data(number, len(sequence))
+        sequence_data["is_rna_mode"] = True
+        sequence_data["rna_sequence"] = sequence
+        sequence_data["dot_bracket"] = structure
+        sequence_data["rna_valid_bases"] = outcome["valid_rna_bases"]
+        sequence_data["rna_checks"] = outcome["checks"]
+        sequence_data["rna_result"] = outcome["result"]
+        sequence_data["pda_messages"] = outcome["messages"]
+        finalize_sequence_data(sequence_data)
+        result["sequences"].append(sequence_data)
+
+    valid_count = sum(1 for outcome in outcomes if outcome["result"] == "Valid")
+    result["runs"] = len(sequences)
+    result["matches"] = valid_count
+    result["all_accepted"] = valid_count == len(sequences)
+    result = add_summary_statistics(result)
+    if mode == "pda" and dump_automaton:
+        result["automaton"] = pda_automaton_dump(structure)
+    return result
@@ -0,0 +1,480 @@
+"""Consistent-hash router in front of several app.py instances.
+
+Each backend instance keeps its own caches (automaton views, packed results)
+and scheduler, so a round-robin balancer spreads identical queries over cold
+caches. This gateway hashes each request onto a ring of instances instead:
+
+- /simulate and /simulate/batch by mode, pattern(s) and dataset (input_path,
+  or a digest of inline sequences), so repeat work lands on the instance that
+  has it cached.
+- Requests on a channel (X-Channel / `channel`) by client and channel, so a
+  newer request reaches the instance running the one it supersedes.
+- /simulate/stream/<id>/... to the instance that opened the session.
+
+Every instance owns ROUTER_VNODES points on the ring. Removing one only moves
+the keys it owned (to the next instance along the ring), and adding it back
+moves exactly those keys back. Instances that fail their /healthz check (every
+ROUTER_HEALTH_INTERVAL seconds) or refuse a connection are skipped until they
+pass again, which doesn't change the ring.
+
+A request goes to the first healthy instance for its key, or spills to the
+second when the first is overloaded: ROUTER_MAX_IN_FLIGHT requests already
+proxied to it, or as many queued in its scheduler. Once an instance has
+accepted a request, its response (including a 503 after a scheduler queue
+timeout) is passed back as is; ROUTER_READ_TIMEOUT is longer than an instance
+can legitimately hold a request.
+
+    python router.py --port 5000 http://127.0.0.1:5001 http://127.0.0.1:5002
+
+Set TRUST_PROXY_HEADERS=1 on the instances so they see the real client
+address (X-Forwarded-For) for scheduling and channels.
+"""
+import argparse
+import bisect
+import hashlib
+import http.client
+import io
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from flask import Flask, Response, jsonify, request
+
+from config import (
+    ROUTER_BACKENDS,
+    ROUTER_CONNECT_TIMEOUT,
+    ROUTER_HEALTH_INTERVAL,
+    ROUTER_MAX_IN_FLIGHT,
+    ROUTER_READ_TIMEOUT,
+    ROUTER_VNODES,
+    BackendConfigError,
+)
+from scheduler import client_id
+from utils import decoded_body
+
+logger = logging.getLogger("automata_simulator")
+
+# Not forwarded in either direction (RFC 9110 section 7.6.1), plus Host.
+HOP_BY_HOP = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+}
+STREAM_SESSIONS_KEPT = 4096
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8", errors="surrogatepass"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring with `vnodes` points per node."""
+
+    def __init__(self, vnodes: int = ROUTER_VNODES):
+        self.vnodes = vnodes
+        self._points: list[int] = []
+        self._owners: list[str] = []
+        self.nodes: set[str] = set()
+
+    def add(self, node: str) -> None:
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.vnodes):
+            point = _hash(f"{node}#{replica}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node: str) -> None:
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def preference(self, key: str):
+        """Distinct nodes in ring order starting at `key`'s position."""
+        if not self._points:
+            return
+        start = bisect.bisect(self._points, _hash(key))
+        seen = set()
+        for offset in range(len(self._points)):
+            owner = self._owners[(start + offset) % len(self._points)]
+            if owner not in seen:
+                seen.add(owner)
+                yield owner
+                if len(seen) == len(self.nodes):
+                    return
+
+
+class Backend:
+    """One app.py instance and what the router knows about its load."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        parts = urlsplit(self.url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.healthy = True
+        self.in_flight = 0
+        self.queued = 0
+        self.requests = 0
+        self.failures = 0
+        self.checked_at = None
+
+    @property
+    def overloaded(self) -> bool:
+        return self.in_flight >= ROUTER_MAX_IN_FLIGHT or self.queued >= ROUTER_MAX_IN_FLIGHT
+
+    def connection(self, timeout: float = ROUTER_CONNECT_TIMEOUT) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def describe(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "requests": self.requests,
+            "failures": self.failures,
+            "checked_at": self.checked_at,
+        }
+
+
+class Router:
+    """Backend pool: ring, health checks, load accounting and stream affinity."""
+
+    def __init__(self, urls: list[str]):
+        self.ring = HashRing()
+        self.backends: dict[str, Backend] = {}
+        self._lock = threading.Lock()
+        self._sessions: OrderedDict[str, str] = OrderedDict()
+        self._checker = None
+        self.spilled = 0
+        for url in urls:
+            self.add(url)
+
+    def add(self, url: str) -> Backend:
+        backend = Backend(url)
+        with self._lock:
+            backend = self.backends.setdefault(backend.url, backend)
+            self.ring.add(backend.url)
+        return backend
+
+    def remove(self, url: str) -> bool:
+        with self._lock:
+            backend = self.backends.pop(url.rstrip("/"), None)
+            if backend is not None:
+                self.ring.remove(backend.url)
+        return backend is not None
+
+    def choices(self, key: str, pinned: Backend | None = None) -> tuple[list[Backend], Backend | None]:
+        """Healthy backends for `key` in the order to try them, and the one the ring prefers.
+
+        An overloaded first choice is tried after the second, unless both are.
+        The request is counted against the backend returned first (see begin()),
+        under the same lock, so a burst can't all see an idle instance.
+        """
+        with self._lock:
+            ordered = [self.backends[url] for url in self.ring.preference(key)]
+            healthy = [backend for backend in ordered if backend.healthy]
+            if pinned is not None:
+                # Stream sessions live on one instance only.
+                healthy = [pinned]
+            preferred = healthy[0] if healthy else None
+            if len(healthy) > 1 and healthy[0].overloaded and not healthy[1].overloaded:
+                healthy[0], healthy[1] = healthy[1], healthy[0]
+            if healthy:
+                healthy[0].in_flight += 1
+                healthy[0].requests += 1
+            return healthy, preferred
+
+    def count_spill(self) -> None:
+        with self._lock:
+            self.spilled += 1
+
+    def begin(self, backend: Backend) -> None:
+        with self._lock:
+            backend.in_flight += 1
+            backend.requests += 1
+
+    def end(self, backend: Backend) -> None:
+        with self._lock:
+            backend.in_flight -= 1
+
+    def mark_down(self, backend: Backend) -> None:
+        with self._lock:
+            backend.healthy = False
+            backend.failures += 1
+        logger.warning(f"Router: {backend.url} is unreachable; skipping it until /healthz passes")
+
+    def remember_session(self, session_id: str, backend: Backend) -> None:
+        with self._lock:
+            self._sessions[session_id] = backend.url
+            while len(self._sessions) > STREAM_SESSIONS_KEPT:
+                self._sessions.popitem(last=False)
+
+    def session_backend(self, session_id: str) -> Backend | None:
+        with self._lock:
+            url = self._sessions.get(session_id)
+            return self.backends.get(url) if url else None
+
+    def check(self, backend: Backend) -> None:
+        """Poll one backend's /healthz and update its state."""
+        healthy, queued = False, 0
+        conn = backend.connection(timeout=max(1.0, ROUTER_HEALTH_INTERVAL))
+        try:
+            conn.request("GET", "/healthz")
+            response = conn.getresponse()
+            body = response.read()
+            if response.status == 200:
+                status = json.loads(body)
+                healthy = status.get("status") == "ok"
+                queued = sum((status.get("scheduler") or {}).get("waiting", {}).values())
+        except (OSError, ValueError, http.client.HTTPException):
+            pass
+        finally:
+            conn.close()
+        with self._lock:
+            if healthy != backend.healthy:
+                logger.info(f"Router: {backend.url} is {'healthy' if healthy else 'unhealthy'}")
+            backend.healthy = healthy
+            backend.queued = queued
+            backend.checked_at = time.time()
+
+    def check_all(self) -> None:
+        with self._lock:
+            backends = list(self.backends.values())
+        for backend in backends:
+            self.check(backend)
+
+    def start(self) -> None:
+        """Start the background health checker (once)."""
+        if self._checker is not None:
+            return
+
+        def run():
+            while True:
+                self.check_all()
+                time.sleep(ROUTER_HEALTH_INTERVAL)
+
+        self._checker = threading.Thread(target=run, name="router-health", daemon=True)
+        self._checker.start()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "backends": [backend.describe() for backend in self.backends.values()],
+                "vnodes": self.ring.vnodes,
+                "spilled": self.spilled,
+                "stream_sessions": len(self._sessions),
+            }
+
+
+def _digest(values: list) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        digest.update(str(value).encode("utf-8", errors="surrogatepass"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def routing_key(path: str, args, body: dict | None, headers, remote_addr: str | None) -> str:
+    """Hash key for a request: what it computes on, or which session/channel it belongs to."""
+    source = body if body is not None else args
+    channel = headers.get("X-Channel") or source.get("channel")
+    if channel and path == "simulate":
+        # The identity the instance scopes channels by: X-API-Key, else the
+        # address the router sees, which ProxyFix gives the instance as the
+        # last X-Forwarded-For hop. Client-sent X-Forwarded-For is ignored.
+        return f"channel\0{client_id(headers, remote_addr)}\0{channel}"
+    mode = str(source.get("mode") or "auto").lower()
+    if path == "simulate/batch":
+        patterns = source.get("patterns") or []
+        pattern = _digest(sorted(str(spec.get("pattern", "") if isinstance(spec, dict) else spec) for spec in patterns))
+    else:
+        pattern = str(source.get("pattern") or "")
+    if source.get("input_path"):
+        dataset = str(source.get("input_path"))
+    elif body is not None:
+        dataset = _digest(body.get("sequences") or [])
+    elif args.getlist("sequences"):
+        dataset = _digest(args.getlist("sequences"))
+    else:
+        # A raw upload (or a stream session): no dataset ID to hash.
+        dataset = ""
+    return f"{mode}\0{pattern}\0{dataset}"
+
+
+router = Router(ROUTER_BACKENDS)
+app = Flask(__name__)
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    snapshot = router.snapshot()
+    healthy = sum(backend["healthy"] for backend in snapshot["backends"])
+    return jsonify({"status": "ok" if healthy else "no-backends", **snapshot}), 200 if healthy else 503
+
+
+@app.route("/router/backends", methods=["GET", "POST", "DELETE"])
+def backends():
+    """List instances, or add/remove one: {"url": "http://127.0.0.1:5003"}."""
+    if request.method == "GET":
+        return jsonify(router.snapshot())
+    body = request.get_json(silent=True)
+    url = body.get("url") if isinstance(body, dict) else None
+    if not isinstance(url, str) or not url.startswith("http://"):
+        return jsonify({"error": "Expected {\"url\": \"http://host:port\"}."}), 400
+    if request.method == "POST":
+        router.check(router.add(url))
+        return jsonify(router.snapshot()), 201
+    if not router.remove(url):
+        return jsonify({"error": f"Unknown backend '{url}'."}), 404
+    return jsonify(router.snapshot())
+
+
+def _forward_headers(body_length: int | None) -> dict:
+    headers = {name: value for name, value in request.headers.items() if name.lower() not in HOP_BY_HOP}
+    forwarded_for = request.headers.get("X-Forwarded-For")
+    headers["X-Forwarded-For"] = f"{forwarded_for}, {request.remote_addr}" if forwarded_for else request.remote_addr
+    headers.pop("Content-Length", None)
+    if body_length is not None:
+        headers["Content-Length"] = str(body_length)
+    return headers
+
+
+def _send(backend: Backend, method: str, target: str, headers: dict, body):
+    conn = backend.connection()
+    try:
+        conn.connect()
+    except OSError:
+        conn.close()
+        raise ConnectionError(backend.url) from None
+    conn.sock.settimeout(ROUTER_READ_TIMEOUT)
+    try:
+        conn.request(method, target, body=body, headers=headers, encode_chunked=body is not None and "Content-Length" not in headers)
+        return conn, conn.getresponse()
+    except BaseException:
+        conn.close()
+        raise
+
+
+def _relay(backend: Backend, conn: http.client.HTTPConnection, upstream: http.client.HTTPResponse, route: str) -> Response:
+    """Stream the backend's response to the client (SSE and exports included)."""
+
+    released = threading.Event()
+
+    def release():
+        # Runs from the generator or on response close, whichever comes first:
+        # HEAD, 204/304 and early disconnects never start the generator.
+        if not released.is_set():
+            released.set()
+            conn.close()
+            router.end(backend)
+
+    def body():
+        try:
+            while True:
+                chunk = upstream.read1(READ_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            release()
+
+    headers = [(name, value) for name, value in upstream.getheaders() if name.lower() not in HOP_BY_HOP | {"content-length"}]
+    if upstream.getheader("Content-Length") is not None:
+        headers.append(("Content-Length", upstream.getheader("Content-Length")))
+    headers += [("X-Routed-To", backend.url), ("X-Route", route)]
+    response = Response(body(), status=upstream.status, headers=headers, direct_passthrough=True)
+    response.call_on_close(release)
+    return response
+
+
+@app.route("/", defaults={"path": ""}, methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
+@app.route("/<path:path>", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
+def proxy(path: str):
+    body, parsed = None, None
+    length = request.content_length
+    if request.mimetype == "application/json":
+        # JSON bodies carry the routing key, so they are read first.
+        body = request.get_data()
+        length = len(body)
+        try:
+            parsed = json.loads(b"".join(decoded_body(io.BytesIO(body), request.headers.get("Content-Encoding"))))
+        except (BackendConfigError, ValueError):
+            # The instance answers with the 400; any key will do.
+            parsed = None
+    elif length or request.headers.get("Transfer-Encoding"):
+        body = request.stream
+
+    parts = path.split("/")
+    if parts[:2] == ["simulate", "stream"] and len(parts) > 2:
+        choices, preferred = router.choices(f"stream\0{parts[2]}", pinned=router.session_backend(parts[2]))
+    else:
+        key = routing_key(path, request.args, parsed if isinstance(parsed, dict) else None, request.headers, request.remote_addr)
+        choices, preferred = router.choices(key)
+    if not choices:
+        return jsonify({"error": "No healthy backend instances."}), 503
+
+    target = request.full_path if request.query_string else request.path
+    headers = _forward_headers(length)
+    for backend in choices:
+        if backend is not choices[0]:
+            router.begin(backend)
+        try:
+            conn, upstream = _send(backend, request.method, target, headers, body)
+        except ConnectionError:
+            # Nothing was sent, so the next instance can take the request.
+            router.end(backend)
+            router.mark_down(backend)
+            continue
+        except (OSError, http.client.HTTPException) as exc:
+            router.end(backend)
+            return jsonify({"error": "Backend request failed", "message": str(exc), "backend": backend.url}), 502
+        if backend is not preferred:
+            router.count_spill()
+        if path == "simulate/stream" and upstream.status == 201:
+            # Later requests for the session must reach this instance.
+            data = upstream.read()
+            conn.close()
+            router.end(backend)
+            try:
+                session_id = json.loads(data).get("session_id")
+            except (ValueError, AttributeError):
+                session_id = None
+            if isinstance(session_id, str):
+                router.remember_session(session_id, backend)
+            response = Response(data, status=201, content_type=upstream.getheader("Content-Type"))
+            response.headers["X-Routed-To"] = backend.url
+            return response
+        return _relay(backend, conn, upstream, "primary" if backend is preferred else "spill")
+    return jsonify({"error": "No backend instance could take the request."}), 503
+
+
+router.start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consistent-hash router for app.py instances.")
+    parser.add_argument("backends", nargs="*", help="Backend base URLs (default: ROUTER_BACKENDS)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    for url in args.backends:
+        router.add(url)
+    router.check_all()
+    app.run(host=args.host, port=args.port, threaded=True)
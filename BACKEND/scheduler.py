@@ -0,0 +1,254 @@
+"""Shortest-job-first scheduler for simulator subprocesses.
+
+Every binary run takes a slot from a fixed pool before it spawns. When the
+pool is full, jobs wait and are dispatched in this order:
+
+- Priority class: interactive jobs go before batch jobs. A batch job that has
+  waited longer than SCHEDULER_BATCH_MAX_WAIT is promoted so it can't starve.
+- SCHEDULER_RESERVED_SLOTS slots are kept for interactive jobs, so a web UI
+  request never waits for a whole batch run to finish.
+- Within a class, the lowest score goes first. The score is the estimated job
+  size, multiplied by (1 + the client's running jobs) for fair share, and
+  divided by (1 + waited / SCHEDULER_AGING_SECONDS) so large jobs age forward.
+
+Job size is estimated from sequence bytes, mode and mismatch budget. The
+scheduler turns sizes into seconds with running averages of the fixed per-run
+overhead (spawn, parse) and of seconds-per-unit, both learned from finished
+runs, and uses them for the wait estimate returned to clients.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from config import (
+    SCHEDULER_AGING_SECONDS,
+    SCHEDULER_BATCH_API_KEYS,
+    SCHEDULER_BATCH_MAX_WAIT,
+    SCHEDULER_INTERACTIVE_MAX_SIZE,
+    SCHEDULER_QUEUE_TIMEOUT,
+    SCHEDULER_RESERVED_SLOTS,
+    SCHEDULER_WORKERS,
+)
+
+PRIORITY_CLASSES = ("interactive", "batch")
+# Relative per-byte cost of each mode; EFA is further scaled by (1 + k).
+MODE_COST = {"dfa": 1.0, "nfa": 2.0, "auto": 2.0, "efa": 2.0, "pda": 3.0}
+# Initial cost model, until real runs have been observed: fixed seconds per run
+# and seconds per size unit. Runs smaller than OVERHEAD_MAX_SIZE only update the
+# overhead, since their time is almost all process startup.
+INITIAL_OVERHEAD = 0.005
+INITIAL_SECONDS_PER_UNIT = 2e-8
+OVERHEAD_MAX_SIZE = 10_000
+RATE_SMOOTHING = 0.2
+
+
+class JobCancelledError(RuntimeError):
+    """Raised when a job is cancelled before it gets a slot."""
+
+    def __init__(self):
+        super().__init__("Simulation was cancelled before it started.")
+
+
+class QueueTimeoutError(RuntimeError):
+    """Raised when a job waits longer than SCHEDULER_QUEUE_TIMEOUT for a slot."""
+
+    def __init__(self, waited: float, position: int):
+        super().__init__(f"Simulation queue is full; waited {waited:.1f}s at position {position}.")
+        self.waited = waited
+        self.position = position
+
+
+def estimate_job_size(payload: dict, dataset_path: str | None) -> float:
+    """Estimate the work of one binary run in size units (weighted sequence bytes)."""
+    sequences = payload.get("sequences") or []
+    if sequences:
+        size = sum(len(seq) for seq in sequences)
+    elif dataset_path:
+        try:
+            size = os.path.getsize(dataset_path)
+        except OSError:
+            size = 0
+    else:
+        size = 0
+    mode = (payload.get("mode") or "auto").lower()
+    factor = MODE_COST.get(mode, MODE_COST["auto"])
+    if mode == "efa":
+        factor *= 1 + max(payload.get("mismatch_budget") or 0, 0)
+    return max(size, 1) * factor
+
+
+def classify(priority: str | None, api_key: str | None, size: float) -> str:
+    """Pick the priority class for a request.
+
+    Pipeline API keys (SCHEDULER_BATCH_API_KEYS) are always batch. Otherwise an
+    explicit X-Priority header wins, and unlabelled requests are interactive
+    when they are small enough.
+    """
+    if api_key and api_key in SCHEDULER_BATCH_API_KEYS:
+        return "batch"
+    if priority:
+        priority = priority.strip().lower()
+        if priority in PRIORITY_CLASSES:
+            return priority
+    return "interactive" if size <= SCHEDULER_INTERACTIVE_MAX_SIZE else "batch"
+
+
+class Job:
+    """One queued simulator run and what the client is told about it."""
+
+    __slots__ = ("client", "priority", "size", "enqueued", "waited", "granted", "cancelled", "position", "estimated_wait")
+
+    def __init__(self, client: str, priority: str, size: float):
+        self.client = client
+        self.priority = priority
+        self.size = size
+        self.enqueued = time.monotonic()
+        self.waited = 0.0
+        self.granted = threading.Event()
+        self.cancelled = False
+        self.position = 0
+        self.estimated_wait = 0.0
+
+    def headers(self) -> dict[str, str]:
+        return {
+            "X-Priority-Class": self.priority,
+            "X-Queue-Position": str(self.position),
+            "X-Estimated-Wait": f"{self.estimated_wait:.3f}",
+        }
+
+
+def client_id(headers, remote_addr: str | None) -> str:
+    """Identify a client by X-API-Key, falling back to the remote address."""
+    return headers.get("X-API-Key") or remote_addr or "local"
+
+
+def request_job(payload: dict, dataset_path: str | None, headers, remote_addr: str | None) -> Job:
+    """Build the job for one simulator run from the request's headers."""
+    size = estimate_job_size(payload, dataset_path)
+    return Job(client_id(headers, remote_addr), classify(headers.get("X-Priority"), headers.get("X-API-Key"), size), size)
+
+
+class Scheduler:
+    """Bounded pool of simulator slots handed out in priority order."""
+
+    def __init__(self, workers: int, reserved: int = 0):
+        self.workers = max(1, workers)
+        # Always leave at least one slot that batch jobs may use.
+        self.reserved = min(max(reserved, 0), self.workers - 1)
+        self._lock = threading.Lock()
+        self._waiting: list[Job] = []
+        self._running: dict[Job, float] = {}
+        self._running_by_client: defaultdict[str, int] = defaultdict(int)
+        self._running_batch = 0
+        self.overhead = INITIAL_OVERHEAD
+        self.seconds_per_unit = INITIAL_SECONDS_PER_UNIT
+
+    def _key(self, job: Job, now: float) -> tuple[int, float]:
+        waited = now - job.enqueued
+        rank = PRIORITY_CLASSES.index(job.priority)
+        if job.priority == "batch" and waited >= SCHEDULER_BATCH_MAX_WAIT:
+            rank = 0
+        score = job.size * (1 + self._running_by_client.get(job.client, 0)) / (1 + waited / SCHEDULER_AGING_SECONDS)
+        return rank, score
+
+    def _seconds(self, job: Job) -> float:
+        return self.overhead + job.size * self.seconds_per_unit
+
+    def _dispatch(self) -> None:
+        # Caller holds the lock.
+        while self._waiting and len(self._running) < self.workers:
+            candidates = self._waiting
+            if self._running_batch >= self.workers - self.reserved:
+                candidates = [waiting for waiting in self._waiting if waiting.priority == "interactive"]
+                if not candidates:
+                    return
+            now = time.monotonic()
+            job = min(candidates, key=lambda waiting: self._key(waiting, now))
+            self._waiting.remove(job)
+            self._running[job] = now
+            job.waited = now - job.enqueued
+            self._running_by_client[job.client] += 1
+            self._running_batch += job.priority == "batch"
+            job.granted.set()
+
+    def _enqueue(self, job: Job) -> None:
+        with self._lock:
+            # Checked under the lock: cancel() may run between the caller's
+            # check and here, and would otherwise miss the job.
+            if job.cancelled:
+                raise JobCancelledError()
+            now = time.monotonic()
+            key = self._key(job, now)
+            ahead = [waiting for waiting in self._waiting if self._key(waiting, now) <= key]
+            self._waiting.append(job)
+            self._dispatch()
+            if job.granted.is_set():
+                return
+            job.position = len(ahead) + 1
+            # Jobs ahead of this one plus half of the running work, spread over the pool.
+            backlog = sum(self._seconds(waiting) for waiting in ahead)
+            backlog += sum(self._seconds(running) for running in self._running) / 2
+            job.estimated_wait = backlog / self.workers
+
+    def _release(self, job: Job) -> None:
+        with self._lock:
+            started = self._running.pop(job)
+            self._running_by_client[job.client] -= 1
+            if not self._running_by_client[job.client]:
+                del self._running_by_client[job.client]
+            self._running_batch -= job.priority == "batch"
+            elapsed = time.monotonic() - started
+            if job.size < OVERHEAD_MAX_SIZE:
+                self.overhead += RATE_SMOOTHING * (elapsed - self.overhead)
+            else:
+                observed = max(elapsed - self.overhead, 0.0) / job.size
+                self.seconds_per_unit += RATE_SMOOTHING * (observed - self.seconds_per_unit)
+            self._dispatch()
+
+    def cancel(self, job: Job) -> None:
+        """Drop a job that hasn't started; a running job is left to its caller."""
+        with self._lock:
+            job.cancelled = True
+            if job in self._waiting:
+                self._waiting.remove(job)
+                job.granted.set()
+
+    @contextmanager
+    def slot(self, job: Job, timeout: float | None = None):
+        """Wait for a free slot in priority order and hold it for the block.
+
+        Raises JobCancelledError if the job is cancelled before it gets one.
+        """
+        self._enqueue(job)
+        timeout = SCHEDULER_QUEUE_TIMEOUT if timeout is None else timeout
+        if not job.granted.wait(timeout):
+            with self._lock:
+                if not job.granted.is_set():
+                    self._waiting.remove(job)
+                    raise QueueTimeoutError(time.monotonic() - job.enqueued, job.position)
+        with self._lock:
+            if job not in self._running:
+                raise JobCancelledError()
+        try:
+            yield job
+        finally:
+            self._release(job)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waiting = defaultdict(int)
+            for job in self._waiting:
+                waiting[job.priority] += 1
+            return {
+                "workers": self.workers,
+                "reserved": self.reserved,
+                "running": len(self._running),
+                "waiting": {priority: waiting[priority] for priority in PRIORITY_CLASSES},
+                "overhead_seconds": self.overhead,
+                "seconds_per_unit": self.seconds_per_unit,
+            }
+
+
+SCHEDULER = Scheduler(SCHEDULER_WORKERS, SCHEDULER_RESERVED_SLOTS)
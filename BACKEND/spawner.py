@@ -0,0 +1,301 @@
+"""Spawn helper: a small pre-started process that launches automata_sim.
+
+Forking the Flask worker to run the binary copies its page tables, so spawn
+latency grows with the worker's heap. Instead, app.py starts this module as
+a separate interpreter at boot (`python spawner.py SOCKET BINARY`). It listens
+on a Unix socket in a private temp directory and launches the binary with
+os.posix_spawn, so its cost doesn't depend on how large the workers grow.
+
+Per launch, a worker connects and sends a length-prefixed JSON request
+({"argv": [...], "fds": [1, 2]}) with the write ends of its stdout/stderr
+pipes attached (SCM_RIGHTS). The helper replies with one JSON line holding
+the child's pid (or an error), and another with its return code once it
+exits. Any byte from the worker, or the worker closing the connection, kills
+the child. The helper only launches the binary it was started with, and it
+exits (killing its children) when the process that started it goes away.
+
+subprocess.Popen has used vfork on Linux since Python 3.10, which is flat
+too, so by default (SPAWN_HELPER=auto) the helper only starts elsewhere (older
+Pythons, macOS). When it isn't running (also Windows, the Vercel functions,
+SPAWN_HELPER=0) or fails, popen() falls back to subprocess.Popen.
+"""
+import atexit
+import json
+import logging
+import os
+import signal
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+
+from config import AUTOMATA_SIM_PATH, SPAWN_HELPER_MODE
+
+logger = logging.getLogger("automata_simulator")
+
+_HEADER = struct.Struct("!I")
+MAX_REQUEST_BYTES = 1024 * 1024
+MAX_FDS = 3
+
+
+def _receive_request(conn: socket.socket) -> tuple[dict, list[int]]:
+    data, fds, _, _ = socket.recv_fds(conn, 65536, MAX_FDS, getattr(socket, "MSG_CMSG_CLOEXEC", 0))
+    try:
+        if len(data) < _HEADER.size:
+            raise ValueError("short request")
+        (size,) = _HEADER.unpack_from(data)
+        if size > MAX_REQUEST_BYTES:
+            raise ValueError("request too large")
+        data = data[_HEADER.size:]
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ValueError("truncated request")
+            data += chunk
+        return json.loads(data), fds
+    except BaseException:
+        for fd in fds:
+            os.close(fd)
+        raise
+
+
+def _reply(conn: socket.socket, message: dict) -> None:
+    conn.sendall(json.dumps(message).encode() + b"\n")
+
+
+class _Children:
+    """Pids the helper has spawned and not yet reaped."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pids: set[int] = set()
+
+    def kill(self, pid: int) -> None:
+        # Under the lock, so a pid is never signalled after it has been reaped.
+        with self.lock:
+            if pid in self.pids:
+                os.kill(pid, signal.SIGKILL)
+
+    def kill_all(self) -> None:
+        with self.lock:
+            for pid in self.pids:
+                os.kill(pid, signal.SIGKILL)
+
+
+def _serve_connection(conn: socket.socket, binary: str, children: _Children) -> None:
+    with conn:
+        try:
+            request, fds = _receive_request(conn)
+        except (OSError, ValueError) as exc:
+            _reply(conn, {"error": f"bad request: {exc}"})
+            return
+        try:
+            argv = request.get("argv")
+            targets = request.get("fds", [])
+            if not isinstance(argv, list) or not argv or argv[0] != binary:
+                raise PermissionError(f"only {binary} may be launched")
+            if len(targets) != len(fds) or not set(targets) <= {0, 1, 2}:
+                raise ValueError("fds must map the passed descriptors to 0, 1 or 2")
+            actions = [(os.POSIX_SPAWN_DUP2, fd, target) for fd, target in zip(fds, targets)]
+            actions += [(os.POSIX_SPAWN_OPEN, target, os.devnull, os.O_RDWR, 0) for target in {0, 1, 2} - set(targets)]
+            with children.lock:
+                pid = os.posix_spawn(binary, argv, os.environ, file_actions=actions)
+                children.pids.add(pid)
+        except (OSError, ValueError) as exc:
+            _reply(conn, {"error": str(exc), "errno": getattr(exc, "errno", None)})
+            return
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+        def watch():
+            try:
+                conn.recv(1)
+            except OSError:
+                pass
+            children.kill(pid)
+
+        threading.Thread(target=watch, daemon=True).start()
+        try:
+            _reply(conn, {"pid": pid})
+        except OSError:
+            children.kill(pid)
+        _, status = os.waitpid(pid, 0)
+        with children.lock:
+            children.pids.discard(pid)
+        try:
+            _reply(conn, {"returncode": os.waitstatus_to_exitcode(status)})
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def serve(socket_path: str, binary: str) -> None:
+    """Run the helper: accept launch requests until stdin (the parent) closes."""
+    children = _Children()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(128)
+
+    def exit_with_parent():
+        sys.stdin.buffer.read()
+        children.kill_all()
+        try:
+            os.unlink(socket_path)
+        finally:
+            os._exit(0)
+
+    threading.Thread(target=exit_with_parent, daemon=True).start()
+    sys.stdout.write("ready\n")
+    sys.stdout.flush()
+    while True:
+        conn, _ = server.accept()
+        threading.Thread(target=_serve_connection, args=(conn, binary, children), daemon=True).start()
+
+
+class HelperProcess:
+    """A child launched through the helper, with the parts of Popen that capture.run_captured uses."""
+
+    def __init__(self, args: list[str], conn: socket.socket, stdout, stderr):
+        self.args = args
+        self._conn = conn
+        self._replies = conn.makefile("rb")
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+        try:
+            reply = self._read_reply()
+            if "pid" not in reply:
+                message = f"spawn helper: {reply.get('error', 'no reply')}"
+                raise OSError(reply["errno"], message) if reply.get("errno") else OSError(message)
+        except BaseException:
+            self._close()
+            stdout.close()
+            stderr.close()
+            raise
+        self.pid = reply["pid"]
+
+    def _read_reply(self) -> dict:
+        line = self._replies.readline()
+        if not line:
+            raise ConnectionError("spawn helper closed the connection")
+        return json.loads(line)
+
+    def _close(self) -> None:
+        self._replies.close()
+        self._conn.close()
+
+    def wait(self) -> int:
+        if self.returncode is None:
+            try:
+                self.returncode = self._read_reply()["returncode"]
+            finally:
+                self._close()
+        return self.returncode
+
+    def kill(self) -> None:
+        try:
+            self._conn.send(b"K")
+        except OSError:
+            pass
+
+
+class SpawnHelper:
+    """Client for (and owner of) the spawn helper process."""
+
+    def __init__(self, binary):
+        self.binary = str(binary)
+        self.socket_path = None
+        self._process = None
+        self._lock = threading.Lock()
+        self._owner = None
+        self.spawned = 0
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self) -> bool:
+        """Start the helper unless disabled or unsupported; returns whether it runs."""
+        if SPAWN_HELPER_MODE in ("0", "false", "no", "off"):
+            return False
+        if SPAWN_HELPER_MODE == "auto" and sys.platform.startswith("linux") and sys.version_info >= (3, 10):
+            return False
+        if not hasattr(os, "posix_spawn") or not hasattr(socket, "AF_UNIX"):
+            return False
+        with self._lock:
+            if self.running:
+                return True
+            self.socket_path = os.path.join(tempfile.mkdtemp(prefix="automata-spawn-"), "spawn.sock")
+            process = subprocess.Popen(
+                [sys.executable, "-E", "-s", os.path.abspath(__file__), self.socket_path, self.binary],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            if process.stdout.readline() != b"ready\n":
+                process.kill()
+                process.wait()
+                logger.warning("Spawn helper failed to start; using subprocess.Popen")
+                return False
+            process.stdout.close()
+            self._process = process
+            self._owner = os.getpid()
+        atexit.register(self.stop)
+        return True
+
+    def stop(self) -> None:
+        """Stop the helper; it kills any children still running."""
+        with self._lock:
+            if self._process is None or self._owner != os.getpid():
+                return
+            self._process.stdin.close()
+            self._process.wait()
+            self._process = None
+            shutil.rmtree(os.path.dirname(self.socket_path), ignore_errors=True)
+
+    def spawn(self, cmd: list[str]) -> HelperProcess:
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            request = json.dumps({"argv": cmd, "fds": [1, 2]}).encode()
+            try:
+                conn.connect(self.socket_path)
+                socket.send_fds(conn, [_HEADER.pack(len(request)) + request], [stdout_write, stderr_write])
+            except OSError as exc:
+                raise ConnectionError(f"spawn helper unreachable: {exc}") from exc
+        except BaseException:
+            conn.close()
+            os.close(stdout_read)
+            os.close(stderr_read)
+            raise
+        finally:
+            os.close(stdout_write)
+            os.close(stderr_write)
+        process = HelperProcess(cmd, conn, os.fdopen(stdout_read, "rb"), os.fdopen(stderr_read, "rb"))
+        self.spawned += 1
+        return process
+
+    def snapshot(self) -> dict:
+        return {"running": self.running, "spawned": self.spawned}
+
+
+def popen(cmd: list[str]):
+    """Start `cmd` with stdout and stderr pipes, through the spawn helper when it runs."""
+    if SPAWN_HELPER.running and cmd and cmd[0] == SPAWN_HELPER.binary:
+        try:
+            return SPAWN_HELPER.spawn(cmd)
+        except ConnectionError as exc:
+            logger.warning(f"Spawn helper unavailable ({exc}); using subprocess.Popen")
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+SPAWN_HELPER = SpawnHelper(AUTOMATA_SIM_PATH)
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1], sys.argv[2])
@@ -0,0 +1,332 @@
+"""Streaming simulation sessions over Server-Sent Events.
+
+A client opens a session with a pattern, mode and mismatch budget, pushes
+sequence chunks with POST requests, and reads match events from an SSE
+stream. A worker thread per session micro-batches pushed chunks: a batch is
+run once it holds `batch_sequences` sequences or `batch_bytes` bytes, or once
+`flush_ms` has passed since its first chunk. Each batch goes through the same
+backend selection as a /simulate/batch pattern, so small batches stay in
+process and large ones go to the binary through the scheduler.
+
+Sessions take input in one of two shapes:
+
+- reads: every pushed sequence is an independent read, numbered in order.
+- continuous: pushed data is one growing sequence. Each batch is prefixed
+  with the last `window` bases of the previous one, so matches up to
+  `window` + 1 bases long that cross a batch boundary are still found.
+
+Backpressure: at most `max_pending_bytes` of unprocessed input and
+STREAM_MAX_PENDING_EVENTS undelivered events are held per session. A slow
+event reader stalls the worker, the input buffer fills, and pushes are then
+refused with StreamBackpressureError until it drains.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Iterator
+
+from batch import run_pattern
+from config import (
+    STREAM_BATCH_MAX_BYTES,
+    STREAM_BATCH_MAX_SEQUENCES,
+    STREAM_FLUSH_INTERVAL_MS,
+    STREAM_HEARTBEAT_SECONDS,
+    STREAM_IDLE_TIMEOUT,
+    STREAM_MAX_PENDING_BYTES,
+    STREAM_MAX_PENDING_EVENTS,
+    STREAM_MAX_SESSIONS,
+    STREAM_WINDOW,
+    STREAM_WINDOW_MAX,
+    BackendConfigError,
+)
+from logger import get_logger
+from utils import write_sequences_to_tempfile
+
+logger = get_logger()
+
+STREAM_MODES = {"auto", "nfa", "dfa", "efa"}
+INPUT_SHAPES = {"reads", "continuous"}
+
+
+class StreamBackpressureError(RuntimeError):
+    """Raised when a push exceeds the session's pending-input limit, or too many sessions are open."""
+
+
+class StreamClosedError(RuntimeError):
+    """Raised when pushing to a session that has been closed."""
+
+
+def _bounded_option(body: dict, name: str, default: int, maximum: int, minimum: int = 1) -> int:
+    value = body.get(name)
+    if value is None:
+        return default
+    if not isinstance(value, int) or isinstance(value, bool) or not minimum <= value <= maximum:
+        raise BackendConfigError(f"'{name}' must be an integer between {minimum} and {maximum}.")
+    return value
+
+
+def parse_session_options(body: dict) -> dict:
+    """Validate a session-open request body; limits can only be lowered below the server's."""
+    pattern = body.get("pattern")
+    if not isinstance(pattern, str) or not pattern:
+        raise BackendConfigError("'pattern' must be a non-empty string.")
+    mode = str(body.get("mode", "auto")).lower()
+    if mode not in STREAM_MODES:
+        raise BackendConfigError(f"Unsupported stream mode '{mode}'.")
+    budget = body.get("mismatch_budget")
+    if budget is not None and not isinstance(budget, int):
+        raise BackendConfigError("'mismatch_budget' must be an integer.")
+    shape = str(body.get("input", "reads")).lower()
+    if shape not in INPUT_SHAPES:
+        raise BackendConfigError(f"'input' must be one of {', '.join(sorted(INPUT_SHAPES))}.")
+    return {
+        "spec": {"pattern": pattern, "mode": mode, "mismatch_budget": budget, "key": pattern},
+        "input": shape,
+        "batch_sequences": _bounded_option(body, "batch_sequences", STREAM_BATCH_MAX_SEQUENCES, STREAM_BATCH_MAX_SEQUENCES),
+        "batch_bytes": _bounded_option(body, "batch_bytes", STREAM_BATCH_MAX_BYTES, STREAM_BATCH_MAX_BYTES),
+        "flush_ms": _bounded_option(body, "flush_ms", STREAM_FLUSH_INTERVAL_MS, 60_000, minimum=0),
+        "window": _bounded_option(body, "window", STREAM_WINDOW, STREAM_WINDOW_MAX, minimum=0),
+        "max_pending_bytes": _bounded_option(body, "max_pending_bytes", STREAM_MAX_PENDING_BYTES, STREAM_MAX_PENDING_BYTES),
+    }
+
+
+def format_event(name: str, data: dict, event_id: int | None = None) -> str:
+    """Format one SSE message."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class StreamSession:
+    """One streaming session: pending input, a batching worker and an event queue."""
+
+    def __init__(self, options: dict, requester: tuple):
+        self.id = uuid.uuid4().hex
+        self.options = options
+        self.spec = options["spec"]
+        self.requester = requester
+        self.last_activity = time.monotonic()
+        self.attached = False
+        self.closed = False
+        self._chunks: deque[str] = deque()
+        self._pending_bytes = 0
+        self._first_pending = None
+        self._cond = threading.Condition()
+        self._events: queue.Queue = queue.Queue(maxsize=STREAM_MAX_PENDING_EVENTS)
+        self._event_id = 0
+        # Next read number (reads) or global offset of the next pushed base (continuous).
+        self._next_sequence = 1
+        self._offset = 0
+        self._carry = ""
+        self.stats = {"batches": 0, "sequences": 0, "bases": 0, "matches": 0, "rejected_pushes": 0}
+        self._worker = threading.Thread(target=self._run, name=f"stream-{self.id[:8]}", daemon=True)
+        self._worker.start()
+
+    def describe(self) -> dict:
+        spec = {key: value for key, value in self.spec.items() if key != "key"}
+        options = {key: value for key, value in self.options.items() if key != "spec"}
+        return {"session_id": self.id, **spec, **options, "stats": dict(self.stats), "closed": self.closed}
+
+    def push(self, sequences: list[str]) -> dict:
+        """Queue sequences (reads) or data (continuous) for the worker."""
+        size = sum(len(seq) for seq in sequences)
+        with self._cond:
+            if self.closed:
+                raise StreamClosedError("Session is closed.")
+            if self._pending_bytes and self._pending_bytes + size > self.options["max_pending_bytes"]:
+                self.stats["rejected_pushes"] += 1
+                raise StreamBackpressureError(
+                    f"Session input buffer is full ({self._pending_bytes} of "
+                    f"{self.options['max_pending_bytes']} bytes pending); retry later."
+                )
+            self._chunks.extend(sequences)
+            self._pending_bytes += size
+            if self._first_pending is None:
+                self._first_pending = time.monotonic()
+            self.last_activity = time.monotonic()
+            self._cond.notify()
+            return {"accepted": len(sequences), "pending_bytes": self._pending_bytes}
+
+    def close(self, drain: bool = True) -> None:
+        """Stop accepting input; pending input is still processed when `drain` is set."""
+        with self._cond:
+            self.closed = True
+            if not drain:
+                self._chunks.clear()
+                self._pending_bytes = 0
+            self._cond.notify()
+
+    def _batch_ready(self) -> bool:
+        if not self._chunks:
+            return False
+        if self.closed or len(self._chunks) >= self.options["batch_sequences"]:
+            return True
+        if self._pending_bytes >= self.options["batch_bytes"]:
+            return True
+        return time.monotonic() - self._first_pending >= self.options["flush_ms"] / 1000
+
+    def _take_batch(self) -> list[str] | None:
+        """Block until a batch is ready; None once the session is closed and drained."""
+        with self._cond:
+            while not self._batch_ready():
+                if self.closed:
+                    return None
+                timeout = None
+                if self._chunks:
+                    timeout = max(self._first_pending + self.options["flush_ms"] / 1000 - time.monotonic(), 0)
+                self._cond.wait(timeout)
+            batch = []
+            size = 0
+            while self._chunks and len(batch) < self.options["batch_sequences"] and size < self.options["batch_bytes"]:
+                chunk = self._chunks.popleft()
+                batch.append(chunk)
+                size += len(chunk)
+            self._pending_bytes -= size
+            self._first_pending = time.monotonic() if self._chunks else None
+            return batch
+
+    def _emit(self, name: str, data: dict) -> bool:
+        """Queue an event, waiting while the reader is behind. False if the session was abandoned."""
+        self._event_id += 1
+        message = format_event(name, data, self._event_id)
+        while True:
+            try:
+                self._events.put(message, timeout=STREAM_HEARTBEAT_SECONDS)
+                return True
+            except queue.Full:
+                if time.monotonic() - self.last_activity > STREAM_IDLE_TIMEOUT:
+                    return False
+
+    def _run(self) -> None:
+        try:
+            while (batch := self._take_batch()) is not None:
+                if not self._process(batch):
+                    break
+            self._emit("end", {"stats": self.stats})
+        except Exception as exc:
+            logger.exception("Stream session %s failed", self.id)
+            self._emit("error", {"error": "Stream worker failed", "message": str(exc)})
+        finally:
+            self.closed = True
+            try:
+                self._events.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def _process(self, batch: list[str]) -> bool:
+        started = time.perf_counter()
+        continuous = self.options["input"] == "continuous"
+        if continuous:
+            data = "".join(batch)
+            base = self._offset
+            sequences = [self._carry + data]
+        else:
+            sequences = batch
+        dataset_path = write_sequences_to_tempfile(sequences)
+        try:
+            result = run_pattern(self.spec, sequences, dataset_path, None, self.requester)
+        finally:
+            os.unlink(dataset_path)
+        if "error" in result:
+            return self._emit("error", {"error": result["error"], "first_sequence": self._next_sequence})
+
+        batch_matches = 0
+        for sequence in result["sequences"]:
+            ranges = [[match["start"], match["end"]] for match in sequence["match_ranges"]]
+            if continuous:
+                # Translate to stream positions and skip matches that lie
+                # entirely in the carried window (reported with the last batch).
+                shift = base - len(self._carry)
+                ranges = [[start + shift, end + shift] for start, end in ranges if end + shift > base]
+                event = {"offset": base, "length": len(data), "matches": ranges}
+            else:
+                event = {
+                    "sequence": self._next_sequence + sequence["sequence_number"] - 1,
+                    "length": sequence["length"],
+                    "matches": ranges,
+                    "states_visited": sequence["states_visited"],
+                }
+            if ranges and not self._emit("matches", event):
+                return False
+            batch_matches += len(ranges)
+
+        first_sequence = self._next_sequence
+        if continuous:
+            self._offset += len(data)
+            window = self.options["window"]
+            self._carry = sequences[0][-window:] if window else ""
+            self.stats["bases"] += len(data)
+        else:
+            self._next_sequence += len(sequences)
+            self.stats["sequences"] += len(sequences)
+            self.stats["bases"] += sum(len(seq) for seq in sequences)
+        self.stats["batches"] += 1
+        self.stats["matches"] += batch_matches
+        return self._emit("batch", {
+            "first_sequence": None if continuous else first_sequence,
+            "sequences": len(batch),
+            "matches": batch_matches,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        })
+
+    def events(self) -> Iterator[str]:
+        """Yield SSE messages until the session ends, with heartbeats while idle."""
+        self.attached = True
+        try:
+            yield format_event("open", self.describe())
+            while True:
+                try:
+                    message = self._events.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                self.last_activity = time.monotonic()
+                if message is None:
+                    SESSIONS.discard(self.id)
+                    return
+                yield message
+        finally:
+            self.attached = False
+
+
+class SessionRegistry:
+    """Open sessions by ID; idle sessions are reaped whenever the registry is used."""
+
+    def __init__(self):
+        self._sessions: dict[str, StreamSession] = {}
+        self._lock = threading.Lock()
+
+    def _reap(self) -> None:
+        # Caller holds the lock.
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if not session.attached and now - session.last_activity > STREAM_IDLE_TIMEOUT:
+                session.close(drain=False)
+                del self._sessions[session_id]
+
+    def open(self, options: dict, requester: tuple) -> StreamSession:
+        with self._lock:
+            self._reap()
+            if len(self._sessions) >= STREAM_MAX_SESSIONS:
+                raise StreamBackpressureError(f"Too many open stream sessions (limit {STREAM_MAX_SESSIONS}).")
+            session = StreamSession(options, requester)
+            self._sessions[session.id] = session
+            return session
+
+    def get(self, session_id: str) -> StreamSession | None:
+        with self._lock:
+            self._reap()
+            return self._sessions.get(session_id)
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+SESSIONS = SessionRegistry()
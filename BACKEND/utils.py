@@ -1,7 +1,36 @@
 """Utility functions for automata simulator API."""
+import itertools
+import json
+import logging
+import os
 import tempfile
+import zlib
+from urllib.parse import unquote
 
-from config import AUTOMATA_SIM_PATH, BackendConfigError
+from flask import Response, g, request
+from werkzeug.datastructures import MultiDict
+
+from config import AUTOMATA_SIM_PATH, EFA_BATCH_MAX_READ_LENGTH, IN_PROCESS_MAX_COST, BackendConfigError
+from engine import IN_PROCESS_MODES
+from logger import RequestTrace
+
+BACKENDS = {"auto", "binary", "inprocess", "bitparallel", "vectorized"}
+AGGREGATION_MAX_BINS = 10000
+AGGREGATION_DEFAULT_TOP_K = 10
+# Bulk export formats (see export.py) and their response mimetypes.
+EXPORT_FORMATS = {
+    "bed": "text/plain",
+    "tsv": "text/tab-separated-values",
+    "npy": "application/octet-stream",
+    "npz": "application/zip",
+}
+# Automaton views (see automaton_view.py).
+AUTOMATON_VIEWS = {"full", "minimal", "compact", "none"}
+# Request body Content-Encodings accepted by POST /simulate, as zlib wbits.
+BODY_ENCODINGS = {"identity": None, "gzip": 16 + zlib.MAX_WBITS, "x-gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+BODY_CHUNK_SIZE = 1024 * 1024
+# Options a JSON body may set that are read as strings, as in the query string.
+STRING_OPTIONS = ("export", "automaton", "channel")
 
 
 def build_command(payload: dict, dataset_path: str, automaton_dump_path: str = None) -> list[str]:
@@ -47,6 +76,235 @@ def build_command(payload: dict, dataset_path: str, automaton_dump_path: str = N
     return cmd
 
 
+def estimate_request_cost(payload: dict) -> int:
+    """Estimate the scan cost of an inline-sequence request.
+
+    Every start position may be scanned to the end of its sequence, so the
+    upper bound is n*(n+1)/2 steps per sequence of length n.
+    """
+    sequences = payload.get("sequences") or []
+    return sum(len(seq) * (len(seq) + 1) // 2 for seq in (s.strip() for s in sequences))
+
+
+def _inline_only(payload: dict) -> list[str] | None:
+    """Return the stripped inline sequences if the request uses nothing but them."""
+    if payload.get("input_path"):
+        return None
+    if payload.get("allow_dot_bracket") or payload.get("rna_mode"):
+        return None
+    if payload.get("secondary_structure_path") or payload.get("secondary_structures"):
+        return None
+    sequences = [seq.strip() for seq in payload.get("sequences") or [] if seq.strip()]
+    if not sequences or not all(seq.isascii() for seq in sequences):
+        return None
+    return sequences
+
+
+def should_run_in_process(payload: dict, enforce_cost: bool = True) -> bool:
+    """Decide whether a request is small and simple enough for the in-process engine."""
+    mode = payload.get("mode", "auto").lower()
+    if mode not in IN_PROCESS_MODES or payload.get("mismatch_budget") is not None:
+        return False
+    sequences = _inline_only(payload)
+    if sequences is None:
+        return False
+    # The binary reads whitespace-delimited lines; leave anything with inner
+    # whitespace to it.
+    if any(ch.isspace() for seq in sequences for ch in seq):
+        return False
+    if not enforce_cost:
+        return True
+    return IN_PROCESS_MAX_COST > 0 and estimate_request_cost(payload) <= IN_PROCESS_MAX_COST
+
+
+def should_run_bitparallel(payload: dict, enforce_read_length: bool = True) -> bool:
+    """Decide whether an EFA request can go through the bit-parallel batch engine."""
+    if payload.get("mode", "auto").lower() != "efa":
+        return False
+    # Imported here so NumPy only loads for EFA requests (cold starts).
+    from efa_engine import MAX_PATTERN_LENGTH
+
+    pattern = payload.get("pattern", "")
+    if not pattern or len(pattern) > MAX_PATTERN_LENGTH:
+        return False
+    if (payload.get("mismatch_budget") or 0) < 0:
+        return False
+    sequences = _inline_only(payload)
+    if sequences is None:
+        return False
+    if not enforce_read_length:
+        return True
+    return max(len(seq) for seq in sequences) <= EFA_BATCH_MAX_READ_LENGTH
+
+
+def should_run_rna_validator(payload: dict) -> bool:
+    """Decide whether an RNA PDA request can go through the vectorized validator."""
+    if payload.get("mode", "auto").lower() not in {"auto", "pda"} or not payload.get("rna_mode"):
+        return False
+    if payload.get("input_path") or payload.get("secondary_structure_path"):
+        return False
+    structures = payload.get("secondary_structures") or []
+    sequences = [seq.strip() for seq in payload.get("sequences") or [] if seq.strip()]
+    return bool(structures and structures[0].strip() and sequences)
+
+
+def select_backend(payload: dict) -> str:
+    """Pick the execution backend for a request: binary, inprocess, bitparallel or vectorized.
+
+    An explicitly requested backend skips the size heuristics but still falls
+    back to the binary when it can't handle the request.
+    """
+    requested = (payload.get("backend") or "auto").lower()
+    if requested not in BACKENDS:
+        raise BackendConfigError(f"Unsupported backend '{requested}'.")
+    if requested == "binary":
+        return "binary"
+    automatic = requested == "auto"
+    if requested in {"auto", "inprocess"} and should_run_in_process(payload, enforce_cost=automatic):
+        return "inprocess"
+    if requested in {"auto", "bitparallel"} and should_run_bitparallel(payload, enforce_read_length=automatic):
+        return "bitparallel"
+    if requested in {"auto", "vectorized"} and should_run_rna_validator(payload):
+        return "vectorized"
+    return "binary"
+
+
+def _int_option(source, name: str, minimum: int) -> int | None:
+    value = source.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise BackendConfigError(f"'{name}' must be an integer.") from None
+    if value < minimum:
+        raise BackendConfigError(f"'{name}' must be at least {minimum}.")
+    return value
+
+
+def parse_aggregation_options(source) -> dict | None:
+    """Read bins/top_k/max_matches/count_only from query args or a JSON body.
+
+    Returns None when none of them is set, so responses keep their full shape.
+    The options are applied by aggregate.summarize_matches.
+    """
+    bins = _int_option(source, "bins", 1)
+    top_k = _int_option(source, "top_k", 0)
+    max_matches = _int_option(source, "max_matches", 0)
+    count_only = source.get("count_only")
+    count_only = count_only if isinstance(count_only, bool) else str(count_only or "").lower() in ("true", "1", "yes")
+    if bins is None and max_matches is None and not count_only:
+        return None
+    if bins is not None and bins > AGGREGATION_MAX_BINS:
+        raise BackendConfigError(f"'bins' must be at most {AGGREGATION_MAX_BINS}.")
+    return {
+        "bins": bins,
+        "top_k": AGGREGATION_DEFAULT_TOP_K if top_k is None else top_k,
+        "max_matches": max_matches,
+        "count_only": count_only,
+    }
+
+
+def parse_automaton_options(source) -> dict:
+    """Read the automaton view (`automaton`) and `automaton_max_states` from query args."""
+    view = (source.get("automaton") or "full").lower()
+    if view not in AUTOMATON_VIEWS:
+        raise BackendConfigError(f"Unsupported automaton view '{view}'; use one of {', '.join(sorted(AUTOMATON_VIEWS))}.")
+    max_states = _int_option(source, "automaton_max_states", 1)
+    if max_states is not None and view != "compact":
+        raise BackendConfigError("'automaton_max_states' requires automaton=compact.")
+    return {"view": view, "max_states": max_states}
+
+
+def parse_export_format(value: str | None) -> str | None:
+    """Validate the `export` option; None means a regular JSON response."""
+    if not value:
+        return None
+    value = value.lower()
+    if value not in EXPORT_FORMATS:
+        raise BackendConfigError(f"Unsupported export format '{value}'; use one of {', '.join(EXPORT_FORMATS)}.")
+    return value
+
+
+def _flag(value) -> bool:
+    return value if isinstance(value, bool) else str(value or "").lower() in ("true", "1", "yes")
+
+
+def _lines(body: dict, name: str) -> list[str]:
+    value = body.get(name)
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return value.splitlines()
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise BackendConfigError(f"'{name}' must be a string or a list of strings.")
+    return value
+
+
+def payload_from_body(body: dict) -> dict:
+    """Build a /simulate payload from a JSON request body.
+
+    Takes the same fields as the query string; `sequences` and
+    `secondary_structures` may be lists or newline-separated strings.
+    """
+    budget = body.get("mismatch_budget")
+    if budget is not None and (isinstance(budget, bool) or not isinstance(budget, int)):
+        raise BackendConfigError("'mismatch_budget' must be an integer.")
+    return {
+        "input_path": body.get("input_path"),
+        "sequences": _lines(body, "sequences"),
+        "mode": str(body.get("mode") or "auto"),
+        "pattern": str(body.get("pattern") or ""),
+        "mismatch_budget": budget,
+        "allow_dot_bracket": _flag(body.get("allow_dot_bracket")),
+        "rna_mode": _flag(body.get("rna_mode")),
+        "secondary_structure_path": body.get("secondary_structure_path"),
+        "secondary_structures": _lines(body, "secondary_structures"),
+        "backend": str(body.get("backend") or "auto"),
+    }
+
+
+def decoded_body(stream, content_encoding: str | None):
+    """Yield a request body in chunks, decompressing gzip/deflate on the fly."""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding not in BODY_ENCODINGS:
+        raise BackendConfigError(f"Unsupported Content-Encoding '{encoding}'; use gzip, deflate or identity.")
+    wbits = BODY_ENCODINGS[encoding]
+    decompressor = zlib.decompressobj(wbits) if wbits else None
+    try:
+        while chunk := stream.read(BODY_CHUNK_SIZE):
+            if decompressor is None:
+                yield chunk
+                continue
+            # Bound each decompressed piece so a small compressed chunk can't
+            # expand into one huge buffer.
+            data = decompressor.decompress(chunk, BODY_CHUNK_SIZE)
+            while data:
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, BODY_CHUNK_SIZE)
+        if decompressor is not None:
+            if not decompressor.eof:
+                raise BackendConfigError("Compressed request body is truncated.")
+            if tail := decompressor.flush():
+                yield tail
+    except zlib.error as exc:
+        raise BackendConfigError(f"Invalid {encoding} request body: {exc}") from None
+
+
+def write_body_to_tempfile(chunks) -> str:
+    """Spool a raw (decoded) request body to a temporary dataset file, chunk by chunk."""
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".txt", mode="wb")
+    try:
+        for chunk in chunks:
+            tmp.write(chunk)
+    except BaseException:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise
+    tmp.close()
+    return tmp.name
+
+
 def write_sequences_to_tempfile(sequences: list[str]) -> str:
     """Write sequences to a temporary file and return the file path."""
     # Use utf-8-sig to write without BOM, or use utf-8 with newline='' to avoid issues
@@ -59,9 +317,147 @@ def write_sequences_to_tempfile(sequences: list[str]) -> str:
     return tmp.name
 
 
+def read_dataset(path: str) -> list[str]:
+    """Read a dataset file the way automata_sim does.
+
+    Each non-empty line is a sequence, with one trailing carriage return
+    removed. After a '>' header line, the following lines are concatenated
+    into one sequence until the next header (FASTA); empty records are skipped.
+    """
+    sequences = []
+    record = None
+    with open(path, "r", encoding="utf-8", errors="replace", newline="\n") as f:
+        for raw in f:
+            line = raw[:-1] if raw.endswith("\n") else raw
+            if line.endswith("\r"):
+                line = line[:-1]
+            if line.startswith(">"):
+                if record:
+                    sequences.append(record)
+                record = ""
+            elif record is not None:
+                record += line
+            elif line:
+                sequences.append(line)
+    if record:
+        sequences.append(record)
+    return sequences
+
+
 def create_automaton_dump_file() -> str:
     """Create a temporary file for automaton dump and return the file path."""
     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".json", mode="w", encoding="utf-8")
     tmp.close()
     return tmp.name
 
+
+# Request plumbing shared by app.py and api/simulate.py. The trace and upload
+# hooks are registered by each app (before/after/teardown_request).
+
+
+def start_trace():
+    g.trace = RequestTrace(request.headers.get("X-Request-ID"))
+
+
+def finish_trace(response):
+    job = g.pop("job", None)
+    if job is not None:
+        response.headers.update(job.headers())
+    trace = g.pop("trace", None)
+    if trace is not None:
+        response.headers["X-Request-ID"] = trace.trace_id
+        trace.finish(
+            logging.getLogger("automata_simulator"),
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            backend=g.get("backend"),
+        )
+    return response
+
+
+def remove_upload(exc):
+    upload_path = g.pop("upload_path", None)
+    if upload_path and os.path.exists(upload_path):
+        os.unlink(upload_path)
+
+
+def export_response(lines, export_format: str, on_close=None) -> Response:
+    """Stream simulator output lines as a bulk export (see export.py)."""
+    from export import LineSource, export
+
+    response = Response(export(LineSource(lines), export_format), mimetype=EXPORT_FORMATS[export_format])
+    response.headers["Content-Disposition"] = f'attachment; filename="matches.{export_format}"'
+    if on_close is not None:
+        response.call_on_close(on_close)
+    return response
+
+
+def query_payload() -> dict:
+    """Build the simulation payload from the query string."""
+    # For input_path, manually parse from raw query string to preserve '+' characters
+    # Flask's args.get() uses unquote_plus() which converts '+' to spaces
+    input_path_value = None
+    query_string = request.query_string.decode("utf-8")
+    if "input_path=" in query_string:
+        # Find the input_path parameter and extract its value
+        start_idx = query_string.find("input_path=") + len("input_path=")
+        # Find the end - either next & or end of string
+        end_idx = query_string.find("&", start_idx)
+        if end_idx == -1:
+            end_idx = len(query_string)
+        # Extract and decode using unquote() to preserve '+' (not unquote_plus())
+        encoded_value = query_string[start_idx:end_idx]
+        input_path_value = unquote(encoded_value) if encoded_value else None
+
+    return {
+        "input_path": input_path_value if input_path_value is not None else request.args.get("input_path"),
+        "sequences": request.args.getlist("sequences"),  # Get list of repeated parameters
+        "mode": request.args.get("mode", "auto"),
+        "pattern": request.args.get("pattern", ""),
+        "mismatch_budget": request.args.get("mismatch_budget", type=int),
+        "allow_dot_bracket": request.args.get("allow_dot_bracket", "").lower() in ("true", "1", "yes"),
+        "rna_mode": request.args.get("rna_mode", "").lower() in ("true", "1", "yes"),
+        "secondary_structure_path": request.args.get("secondary_structure_path"),
+        "secondary_structures": request.args.getlist("secondary_structures"),  # Inline dot-bracket notation
+        "backend": request.args.get("backend", "auto"),
+    }
+
+
+def request_payload() -> tuple[dict, MultiDict]:
+    """Build the simulation payload and option source for GET or POST /simulate.
+
+    POST takes either a JSON body with the query-string fields (options such
+    as `export` may go in the body too), or a raw text/plain or
+    application/octet-stream dataset, optionally gzip/deflate-encoded, with the
+    other fields in the query string. Raw bodies are decoded chunk by chunk
+    into a temporary input file for the binary, so there is no size limit.
+    """
+    options = MultiDict(request.args)
+    if request.method != "POST":
+        return query_payload(), options
+    if request.mimetype == "application/json":
+        chunks = decoded_body(request.stream, request.headers.get("Content-Encoding"))
+        try:
+            body = json.loads(b"".join(chunks))
+        except ValueError:
+            raise BackendConfigError("Request body is not valid JSON.") from None
+        if not isinstance(body, dict):
+            raise BackendConfigError("Request body must be a JSON object.")
+        for name in STRING_OPTIONS:
+            if body.get(name) is not None and not isinstance(body[name], str):
+                raise BackendConfigError(f"'{name}' must be a string.")
+        for name, value in body.items():
+            options[name] = value
+        return payload_from_body(body), options
+    payload = query_payload()
+    chunks = decoded_body(request.stream, request.headers.get("Content-Encoding"))
+    first = next((chunk for chunk in chunks if chunk), b"")
+    if not first:
+        # No body after all (e.g. a POST with only a query string).
+        return payload, options
+    if payload["input_path"] or payload["sequences"]:
+        raise BackendConfigError("Send the dataset either as the request body or as input_path/sequences, not both.")
+    g.upload_path = write_body_to_tempfile(itertools.chain([first], chunks))
+    payload["input_path"] = g.upload_path
+    return payload, options
@@ -10,10 +10,11 @@ CORS(app, origins=["https://automata-simulator-web.vercel.app", "http://localhos
 
 # Add BACKEND to path
 backend_dir = Path(__file__).resolve().parent.parent / "BACKEND"
-sys.path.insert(0, str(backend_dir))
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
 
 try:
-    from config import AUTOMATA_SIM_PATH
+    from config import AUTOMATA_SIM_PATH, BINARY_MANIFEST
     
     @app.route('/')
     @app.route('/api/healthz')
@@ -22,7 +23,8 @@ try:
         return jsonify({
             "status": "ok" if exists else "binary-missing",
             "binary": str(AUTOMATA_SIM_PATH),
-            "exists": exists
+            "exists": exists,
+            "manifest": BINARY_MANIFEST["capabilities"] if BINARY_MANIFEST else None,
         })
         
 except Exception as e:
@@ -1,34 +1,55 @@
 """Simulate endpoint for Vercel - uses exact same logic as BACKEND/app.py"""
 import json
-import logging
 import os
 import subprocess
 import sys
 import traceback
 from pathlib import Path
-from urllib.parse import unquote
 
-from flask import Flask, jsonify, request
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
 
 # Add BACKEND to path so we can import from it
 backend_dir = Path(__file__).resolve().parent.parent / "BACKEND"
-sys.path.insert(0, str(backend_dir))
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
 os.environ["VERCEL"] = "1"
 
 # Import BACKEND modules
-from config import AUTOMATA_SIM_PATH, BackendConfigError, ensure_binary_available
-from logger import get_logger
-from parser import parse_stdout
-from utils import build_command, write_sequences_to_tempfile, create_automaton_dump_file
+from automaton_view import AUTOMATON_CACHE, attach_view, cache_key, view_and_cache
+from capture import cached_metrics, resolve_memory_budget, run_captured
+from config import AUTOMATA_SIM_PATH, BackendConfigError, binary_supports, ensure_binary_available
+from engine import UnsupportedPatternError, simulate_in_process
+from logger import PAYLOAD_MAX_CHARS, get_logger
+from packed import RESULT_CACHE, result_cache_key
+from parser import parse_lines, parse_stdout
+from scheduler import SCHEDULER, QueueTimeoutError, request_job
+from utils import (
+    build_command,
+    create_automaton_dump_file,
+    export_response,
+    finish_trace,
+    parse_aggregation_options,
+    parse_automaton_options,
+    parse_export_format,
+    remove_upload,
+    request_payload,
+    select_backend,
+    start_trace,
+    write_sequences_to_tempfile,
+)
 
 app = Flask(__name__)
 # Configure CORS - allow frontend origin
 CORS(app, origins=["https://automata-simulator-web.vercel.app", "http://localhost:3000"])
 logger = get_logger()
+app.before_request(start_trace)
+app.after_request(finish_trace)
+app.teardown_request(remove_upload)
 
-@app.route('/', methods=["GET"])
-@app.route('/api/simulate', methods=["GET"])
+
+@app.route('/', methods=["GET", "POST"])
+@app.route('/api/simulate', methods=["GET", "POST"])
 def simulate():
     try:
         try:
@@ -38,33 +59,83 @@ def simulate():
         except Exception as exc:
             return jsonify({"error": "Binary check failed", "message": str(exc), "type": type(exc).__name__}), 500
 
-        # Extract parameters from query string
-        # For input_path, manually parse from raw query string to preserve '+' characters
-        # Flask's args.get() uses unquote_plus() which converts '+' to spaces
-        input_path_value = None
-        query_string = request.query_string.decode("utf-8")
-        if "input_path=" in query_string:
-            # Find the input_path parameter and extract its value
-            start_idx = query_string.find("input_path=") + len("input_path=")
-            # Find the end - either next & or end of string
-            end_idx = query_string.find("&", start_idx)
-            if end_idx == -1:
-                end_idx = len(query_string)
-            # Extract and decode using unquote() to preserve '+' (not unquote_plus())
-            encoded_value = query_string[start_idx:end_idx]
-            input_path_value = unquote(encoded_value) if encoded_value else None
-        
-        payload = {
-            "input_path": input_path_value if input_path_value is not None else request.args.get("input_path"),
-            "sequences": request.args.getlist("sequences"),  # Get list of repeated parameters
-            "mode": request.args.get("mode", "auto"),
-            "pattern": request.args.get("pattern", ""),
-            "mismatch_budget": request.args.get("mismatch_budget", type=int),
-            "allow_dot_bracket": request.args.get("allow_dot_bracket", "").lower() in ("true", "1", "yes"),
-            "rna_mode": request.args.get("rna_mode", "").lower() in ("true", "1", "yes"),
-            "secondary_structure_path": request.args.get("secondary_structure_path"),
-            "secondary_structures": request.args.getlist("secondary_structures"),  # Inline dot-bracket notation
-        }
+        try:
+            payload, options = request_payload()
+        except BackendConfigError as exc:
+            return jsonify({"error": str(exc)}), 400
+
+        trace = g.trace
+        try:
+            backend = select_backend(payload)
+            g.backend = backend
+            # bins/top_k/max_matches/count_only summarize matches server-side.
+            aggregation = parse_aggregation_options(options)
+            memory_budget = resolve_memory_budget(options.get("memory_budget", type=int))
+            # export=bed|tsv|npy|npz streams matches instead of returning JSON.
+            export_format = parse_export_format(options.get("export"))
+            # automaton=full|minimal|compact|none (see automaton_view.py).
+            automaton_options = parse_automaton_options(options)
+        except BackendConfigError as exc:
+            return jsonify({"error": str(exc)}), 400
+        automaton_key = cache_key(payload, automaton_options)
+        cached_automaton = AUTOMATON_CACHE.get(automaton_key)
+        wants_dump = cached_automaton is None and automaton_options["view"] != "none"
+
+        # Small inline NFA/DFA requests, short-read EFA batches and inline RNA
+        # structure checks are cheaper to run in process than to fork the
+        # binary; fall through to it for anything the engines can't mirror.
+        # The NumPy engines are imported on first use to keep cold starts fast.
+        if backend == "inprocess":
+            try:
+                with trace.stage("inprocess"):
+                    stdout, automaton_data = simulate_in_process(payload, dump_automaton=wants_dump and not export_format)
+            except UnsupportedPatternError as exc:
+                logger.debug(f"In-process engine skipped: {exc}")
+            else:
+                if export_format:
+                    return export_response(stdout.strip().split("\n"), export_format)
+                with trace.stage("parse"):
+                    parsed_result = parse_stdout(stdout, aggregation)
+                if cached_automaton is None:
+                    automaton_data = view_and_cache(automaton_data, automaton_options, automaton_key)
+                else:
+                    automaton_data = cached_automaton
+                if automaton_data is not None:
+                    parsed_result["automaton"] = automaton_data
+                return jsonify(parsed_result), 200
+        elif backend == "bitparallel" and not export_format:
+            from efa_engine import UnsupportedBatchError, simulate_efa_batch
+
+            try:
+                with trace.stage("bitparallel"):
+                    result = simulate_efa_batch(payload, aggregation, dump_automaton=wants_dump)
+                return jsonify(attach_view(result, cached_automaton, automaton_options, automaton_key)), 200
+            except UnsupportedBatchError as exc:
+                logger.debug(f"Bit-parallel engine skipped: {exc}")
+        elif backend == "vectorized" and not export_format:
+            from pda_validator import UnsupportedValidationError, simulate_rna_batch
+
+            try:
+                with trace.stage("vectorized"):
+                    result = simulate_rna_batch(payload, dump_automaton=wants_dump)
+                return jsonify(attach_view(result, cached_automaton, automaton_options, automaton_key)), 200
+            except UnsupportedValidationError as exc:
+                logger.debug(f"Vectorized RNA validator skipped: {exc}")
+        g.backend = "binary"
+
+        # Repeat queries over an unchanged dataset are served from packed
+        # results (see packed.py); uploads and exports aren't cached.
+        result_key = None
+        if not export_format and not g.get("upload_path"):
+            result_key = result_cache_key(payload, aggregation, automaton_options)
+        cached_result = RESULT_CACHE.get(result_key)
+        if cached_result is not None:
+            with trace.stage("expand"):
+                cached = cached_result.to_dict()
+                cached["metrics"] = cached_metrics(memory_budget)
+                response = jsonify(cached)
+            response.headers["X-Result-Cache"] = "hit"
+            return response, 200
 
         dataset_path = payload.get("input_path")
         temp_dataset_path = None
@@ -91,7 +162,9 @@ def simulate():
 
         # Create temp file for automaton dump if the selected mode supports it
         # (NFA, DFA, EFA, PDA). AUTO mode doesn't specify which automaton is built.
-        if mode in {"nfa", "dfa", "efa", "pda"}:
+        # Skip it when the build-time manifest says the binary lacks the flag,
+        # and when the requested view is already cached or not wanted.
+        if mode in {"nfa", "dfa", "efa", "pda"} and binary_supports("dump_automaton") and wants_dump and not export_format:
             automaton_dump_path = create_automaton_dump_file()
 
         try:
@@ -105,53 +178,52 @@ def simulate():
                 os.unlink(automaton_dump_path)
             return jsonify({"error": str(exc)}), 400
 
-        # Log command when in debug mode
-        if app.debug or os.environ.get("FLASK_DEBUG", "").lower() in ("true", "1", "yes"):
-            logger.debug(f"Executing command: {' '.join(cmd)}")
-            logger.debug(f"Command arguments: {cmd}")
+        # Large payloads are only logged in debug mode, for a sample of
+        # requests, and capped (see logger.py).
+        trace.log_payload(logger, "Executing command", command=" ".join(cmd))
 
+        # Binary runs wait for a scheduler slot: interactive before batch,
+        # shortest job first within a class (see scheduler.py).
+        job = request_job(payload, dataset_path, request.headers, request.remote_addr)
+        g.job = job
         try:
-            completed = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                encoding="utf-8",
-                errors="replace",
-                check=False,
-                timeout=30,  # 30 second timeout for Vercel
-            )
+            with SCHEDULER.slot(job):
+                trace.record("queue", job.waited)
+                # stdout beyond memory_budget bytes is spooled to disk instead of
+                # being held (and copied) in memory; see capture.py.
+                with trace.stage("binary"):
+                    completed = run_captured(cmd, memory_budget, timeout=30)  # 30 second timeout for Vercel
             
-            # Log execution result when in debug mode
-            if app.debug or os.environ.get("FLASK_DEBUG", "").lower() in ("true", "1", "yes"):
-                logger.debug(f"Command return code: {completed.returncode}")
-                if completed.stdout:
-                    logger.debug(f"Command stdout (first 500 chars): {completed.stdout[:500]}")
-                if completed.stderr:
-                    logger.debug(f"Command stderr: {completed.stderr}")
+                if trace.sampled:
+                    trace.log_payload(
+                        logger,
+                        "Command finished",
+                        returncode=completed.returncode,
+                        stdout=completed.stdout.head(PAYLOAD_MAX_CHARS),
+                        stderr=completed.stderr,
+                    )
             
-            # If command failed and it's due to unsupported --dump-automaton flag, retry without it
-            if (completed.returncode != 0 and automaton_dump_path and 
-                "--dump-automaton" in " ".join(cmd) and
-                ("Unknown or incomplete argument" in completed.stderr or 
-                 "unknown" in completed.stderr.lower() and "dump-automaton" in completed.stderr.lower())):
-                logger.warning("Binary doesn't support --dump-automaton flag, retrying without it")
-                # Clean up the dump file since we're not using it
-                if os.path.exists(automaton_dump_path):
-                    os.unlink(automaton_dump_path)
-                # Remove --dump-automaton flag and retry
-                cmd_without_dump = [arg for arg in cmd if arg != "--dump-automaton" and arg != automaton_dump_path]
-                completed = subprocess.run(
-                    cmd_without_dump,
-                    capture_output=True,
-                    text=True,
-                    encoding="utf-8",
-                    errors="replace",
-                    check=False,
-                )
-                # Clear automaton_dump_path since we're not using it
-                automaton_dump_path = None
-                if app.debug or os.environ.get("FLASK_DEBUG", "").lower() in ("true", "1", "yes"):
-                    logger.debug(f"Retry command return code: {completed.returncode}")
+                # If command failed and it's due to unsupported --dump-automaton flag, retry without it
+                if (completed.returncode != 0 and automaton_dump_path and 
+                    "--dump-automaton" in " ".join(cmd) and
+                    ("Unknown or incomplete argument" in completed.stderr or 
+                     "unknown" in completed.stderr.lower() and "dump-automaton" in completed.stderr.lower())):
+                    logger.warning("Binary doesn't support --dump-automaton flag, retrying without it")
+                    # Clean up the dump file since we're not using it
+                    if os.path.exists(automaton_dump_path):
+                        os.unlink(automaton_dump_path)
+                    # Remove --dump-automaton flag and retry
+                    cmd_without_dump = [arg for arg in cmd if arg != "--dump-automaton" and arg != automaton_dump_path]
+                    completed.stdout.close()
+                    with trace.stage("binary"):
+                        completed = run_captured(cmd_without_dump, memory_budget)
+                    # Clear automaton_dump_path since we're not using it
+                    automaton_dump_path = None
+                    trace.log_payload(logger, "Retry command finished", returncode=completed.returncode)
+        except QueueTimeoutError as exc:
+            if automaton_dump_path and os.path.exists(automaton_dump_path):
+                os.unlink(automaton_dump_path)
+            return jsonify({"error": str(exc)}), 503, {"Retry-After": str(max(1, round(job.estimated_wait)))}
         except subprocess.TimeoutExpired:
             if temp_dataset_path:
                 os.unlink(temp_dataset_path)
@@ -175,20 +247,23 @@ def simulate():
                 os.unlink(temp_secondary_path)
 
         # Parse stdout into structured JSON
+        if completed.returncode == 0 and export_format:
+            # Streams from the (possibly spooled) output; closed once sent.
+            return export_response(completed.stdout.lines(), export_format, on_close=completed.stdout.close)
         if completed.returncode == 0:
-            # Debug: Log raw stdout when in debug mode
-            if app.debug or os.environ.get("FLASK_DEBUG", "").lower() in ("true", "1", "yes"):
-                logger.debug(f"Raw stdout from C++ binary:\n{completed.stdout}")
-            
-            parsed_result = parse_stdout(completed.stdout)
+            with completed.stdout, trace.stage("parse"):
+                parsed_result = parse_lines(completed.stdout.lines(), aggregation)
+                parsed_result["metrics"] = completed.stdout.metrics()
             
             # Load automaton structure from dump file if it exists
             # Works for NFA, DFA, EFA, and PDA modes (if binary supports --dump-automaton)
-            if automaton_dump_path and os.path.exists(automaton_dump_path):
+            if cached_automaton is not None:
+                parsed_result["automaton"] = cached_automaton
+            elif automaton_dump_path and os.path.exists(automaton_dump_path):
                 try:
                     with open(automaton_dump_path, "r", encoding="utf-8") as f:
                         automaton_data = json.load(f)
-                        parsed_result["automaton"] = automaton_data
+                    parsed_result["automaton"] = view_and_cache(automaton_data, automaton_options, automaton_key)
                 except (json.JSONDecodeError, IOError) as e:
                     logger.warning(f"Failed to read automaton dump file: {e}")
                 finally:
@@ -196,17 +271,23 @@ def simulate():
                     if os.path.exists(automaton_dump_path):
                         os.unlink(automaton_dump_path)
             
-            return jsonify(parsed_result), 200
+            response = jsonify(parsed_result)
+            if result_key is not None:
+                # Packed once the response is sent, off the request's latency.
+                response.call_on_close(lambda: RESULT_CACHE.put(result_key, parsed_result))
+            return response, 200
         else:
             # Clean up automaton dump file and temp secondary file on error
             if automaton_dump_path and os.path.exists(automaton_dump_path):
                 os.unlink(automaton_dump_path)
             if temp_secondary_path and os.path.exists(temp_secondary_path):
                 os.unlink(temp_secondary_path)
+            with completed.stdout:
+                stdout_head = completed.stdout.head(500) if completed.stdout else ""
             return jsonify({
                 "error": "Simulation failed",
                 "stderr": completed.stderr,
-                "stdout": completed.stdout[:500] if completed.stdout else "",
+                "stdout": stdout_head,
                 "returncode": completed.returncode,
                 "command": " ".join(cmd)
             }), 500
@@ -218,3 +299,32 @@ def simulate():
             "type": type(e).__name__,
             "traceback": traceback.format_exc()
         }), 500
+
+
+@app.route("/api/simulate/batch", methods=["POST"])
+def simulate_batch():
+    """Run many patterns against one dataset: {"patterns": [...], "sequences" | "input_path": ...}."""
+    try:
+        try:
+            ensure_binary_available()
+        except BackendConfigError as exc:
+            return jsonify({"error": str(exc)}), 400
+
+        from batch import run_batch
+
+        g.backend = "batch"
+
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({"error": "Expected a JSON object body."}), 400
+        try:
+            return jsonify(run_batch(body, request.headers, request.remote_addr)), 200
+        except BackendConfigError as exc:
+            return jsonify({"error": str(exc)}), 400
+    except Exception as e:
+        return jsonify({
+            "error": "Unhandled exception in /simulate/batch",
+            "message": str(e),
+            "type": type(e).__name__,
+            "traceback": traceback.format_exc()
+        }), 500